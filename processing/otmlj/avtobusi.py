@@ -1,6 +1,11 @@
+import base64
+import csv
 from dataclasses import dataclass
+from datetime import date, timedelta
 from typing import Optional
 
+import numpy
+
 from otmlj.common import LatitudeLongitude
 
 
@@ -115,102 +120,178 @@ def parse_bus_stops_from_raw_csv_data(
 
 
 
-@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
-class BusArrival:
-    trip_id: str
-    arrival_time: TimeOfDay
-    departure_time: TimeOfDay
-    stop_id: str
-    stop_sequence: int
-
-    def serialize(self) -> dict:
-        return {
-            "trip_id": self.trip_id,
-            "arrival_time": self.arrival_time.serialize(),
-            "departure_time": self.departure_time.serialize(),
-            "stop_id": self.stop_id,
-            "stop_sequence": self.stop_sequence
-        }
+# Trips of 2024-05-08 in the LPP_2024-05-09 feed all contain this service id.
+DEFAULT_SERVICE_DAY_TRIP_ID_MARKER: str = "ddfb999e-c766-48e1-a5c5-e97e5b09e19c"
 
-    def serialize_bare(self) -> tuple[int, int]:
-        return self.arrival_time.serialize()
 
+def is_trip_active(trip_id: str, active_trip_ids: Optional[set[str]]) -> bool:
+    """
+    :param active_trip_ids: trips to keep (see `find_trip_ids_active_on_date`);
+        if not given, only trips of 2024-05-08 in the LPP_2024-05-09 feed are kept
+    """
 
-def parse_daily_bus_stop_entries_from_raw_csv_data(
-    raw_csv_data: str
-) -> list[BusArrival]:
-    # Extract lines, with the first one containing column names
-    # and subsequent ones containing data.
-    lines = raw_csv_data.splitlines(keepends=False)
+    if active_trip_ids is not None:
+        return trip_id in active_trip_ids
 
+    return DEFAULT_SERVICE_DAY_TRIP_ID_MARKER in trip_id
 
-    column_names = lines[0].split(",")
 
-    def get_column_index_by_name(name: str) -> Optional[int]:
-        for index, column_name in enumerate(column_names):
-            if column_name == name:
-                return index
+def parse_gtfs_date(raw_date: str) -> date:
+    # GTFS dates are formatted as YYYYMMDD.
+    return date(int(raw_date[0:4]), int(raw_date[4:6]), int(raw_date[6:8]))
+
+
+def read_csv_rows_as_dicts(
+    raw_csv_data: str,
+    required_column_names: list[str]
+) -> list[dict[str, str]]:
+    # Unlike stops.txt and stop_times.txt, calendars and trips can contain quoted
+    # fields with commas (e.g. trip headsigns), so these are read with the csv module.
+    reader = csv.DictReader(raw_csv_data.splitlines(keepends=False))
+
+    if reader.fieldnames is None or any(
+        column_name not in reader.fieldnames
+        for column_name in required_column_names
+    ):
+        raise RuntimeError(
+            f"Invalid input data: expected {', '.join(required_column_names)} columns."
+        )
+
+    return list(reader)
 
+
+WEEKDAY_COLUMN_NAMES: list[str] = [
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"
+]
+
+
+def read_calendar_rows(
+    raw_calendar_csv_data: Optional[str],
+    weekday: int
+) -> Optional[list[dict[str, str]]]:
+    if raw_calendar_csv_data is None:
         return None
 
+    return read_csv_rows_as_dicts(
+        raw_calendar_csv_data,
+        ["service_id", WEEKDAY_COLUMN_NAMES[weekday], "start_date", "end_date"]
+    )
 
-    data_rows: list[list[str]] = []
-    for unparsed_data_line in lines[1:]:
-        data_row = unparsed_data_line.split(",")
 
-        if len(data_row) != len(column_names):
-            raise RuntimeError(f"data does not have all the columns: {data_row}")
+def read_calendar_dates_rows(
+    raw_calendar_dates_csv_data: Optional[str]
+) -> Optional[list[dict[str, str]]]:
+    if raw_calendar_dates_csv_data is None:
+        return None
 
-        data_rows.append(data_row)
+    return read_csv_rows_as_dicts(
+        raw_calendar_dates_csv_data,
+        ["service_id", "date", "exception_type"]
+    )
 
 
+def find_service_ids_active_on_date_in_rows(
+    calendar_rows: Optional[list[dict[str, str]]],
+    calendar_dates_rows: Optional[list[dict[str, str]]],
+    service_date: date
+) -> set[str]:
+    """
+    Same as `find_service_ids_active_on_date`, for rows already read
+    by `read_calendar_rows` and `read_calendar_dates_rows`.
+    """
 
-    parsed_stop_times: list[BusArrival] = []
+    active_service_ids: set[str] = set()
 
-    trip_id_column_index = get_column_index_by_name("trip_id")
-    arrival_time_column_index = get_column_index_by_name("arrival_time")
-    departure_time_column_index = get_column_index_by_name("departure_time")
-    stop_id_column_index = get_column_index_by_name("stop_id")
-    stop_sequence_column_index = get_column_index_by_name("stop_sequence")
+    if calendar_rows is not None:
+        weekday_column_name = WEEKDAY_COLUMN_NAMES[service_date.weekday()]
 
-    if None in [
-        trip_id_column_index, arrival_time_column_index, departure_time_column_index,
-        stop_id_column_index, stop_sequence_column_index
-    ]:
-        raise RuntimeError(
-            "Invalid input data: expected trip_id, arrival_time, \
-            departure_time, stop_id and stop_sequence columns."
-        )
+        for row in calendar_rows:
+            is_in_range = parse_gtfs_date(row["start_date"]) <= service_date <= parse_gtfs_date(row["end_date"])
 
+            if is_in_range and row[weekday_column_name] == "1":
+                active_service_ids.add(row["service_id"])
 
-    for split_data_line in data_rows:
-        trip_id = str(split_data_line[trip_id_column_index])
+    if calendar_dates_rows is not None:
+        for row in calendar_dates_rows:
+            if parse_gtfs_date(row["date"]) != service_date:
+                continue
 
-        # This ignores trips that are not on 2024-05-08.
-        if "ddfb999e-c766-48e1-a5c5-e97e5b09e19c" not in trip_id:
-            continue
+            # Exception type 1 adds the service on that date, 2 removes it.
+            if row["exception_type"] == "1":
+                active_service_ids.add(row["service_id"])
+            elif row["exception_type"] == "2":
+                active_service_ids.discard(row["service_id"])
 
-        arrival_time_raw = str(split_data_line[arrival_time_column_index])
-        departure_time_raw = str(split_data_line[departure_time_column_index])
-        stop_id = str(split_data_line[stop_id_column_index])
-        stop_sequence = int(split_data_line[stop_sequence_column_index])
+    return active_service_ids
 
-        arrival_time = TimeOfDay.from_colon_separated_hms(arrival_time_raw)
-        departure_time = TimeOfDay.from_colon_separated_hms(departure_time_raw)
 
+def find_service_ids_active_on_date(
+    raw_calendar_csv_data: Optional[str],
+    raw_calendar_dates_csv_data: Optional[str],
+    service_date: date
+) -> set[str]:
+    """
+    Resolves which services run on the given date from calendar.txt
+    and the exceptions in calendar_dates.txt (either may be missing).
+    """
 
-        daily_stop_entry = BusArrival(
-            trip_id=trip_id,
-            arrival_time=arrival_time,
-            departure_time=departure_time,
-            stop_id=stop_id,
-            stop_sequence=stop_sequence,
-        )
+    return find_service_ids_active_on_date_in_rows(
+        read_calendar_rows(raw_calendar_csv_data, service_date.weekday()),
+        read_calendar_dates_rows(raw_calendar_dates_csv_data),
+        service_date
+    )
+
+
+def find_first_service_date_on_weekday(
+    raw_calendar_csv_data: Optional[str],
+    raw_calendar_dates_csv_data: Optional[str],
+    weekday: int
+) -> date:
+    """
+    :param weekday: 0 for Monday through 6 for Sunday
+    :return: the earliest date in the feed that falls on the weekday and has any service
+    """
 
-        parsed_stop_times.append(daily_stop_entry)
+    # Both files are read once; every candidate date is evaluated against the same rows.
+    calendar_rows = read_calendar_rows(raw_calendar_csv_data, weekday)
+    calendar_dates_rows = read_calendar_dates_rows(raw_calendar_dates_csv_data)
 
+    candidate_dates: set[date] = set()
 
-    return parsed_stop_times
+    if calendar_rows is not None:
+        for row in calendar_rows:
+            start_date = parse_gtfs_date(row["start_date"])
+            # A year of candidates is plenty, feeds are usually valid for a few months.
+            for day_offset in range(min((parse_gtfs_date(row["end_date"]) - start_date).days + 1, 366)):
+                candidate_dates.add(start_date + timedelta(days=day_offset))
+
+    if calendar_dates_rows is not None:
+        for row in calendar_dates_rows:
+            candidate_dates.add(parse_gtfs_date(row["date"]))
+
+    for candidate_date in sorted(candidate_dates):
+        if candidate_date.weekday() != weekday:
+            continue
+
+        if len(find_service_ids_active_on_date_in_rows(
+            calendar_rows,
+            calendar_dates_rows,
+            candidate_date
+        )) > 0:
+            return candidate_date
+
+    raise RuntimeError(f"The feed has no service on weekday {weekday}.")
+
+
+def find_trip_ids_active_on_date(
+    raw_trips_csv_data: str,
+    active_service_ids: set[str]
+) -> set[str]:
+    return {
+        row["trip_id"]
+        for row in read_csv_rows_as_dicts(raw_trips_csv_data, ["trip_id", "service_id"])
+        if row["service_id"] in active_service_ids
+    }
 
 
 class ArrivalsPerHourOfDay:
@@ -222,7 +303,7 @@ class ArrivalsPerHourOfDay:
         self.arrivals = [0 for _ in range(24)]
 
     def increment_by_one(self, time_of_day: TimeOfDay):
-        self.arrivals[time_of_day.hour - 1] += 1
+        self.arrivals[minute_of_day(time_of_day) // 60] += 1
 
     def serialize(self) -> list[int]:
         return self.arrivals
@@ -247,26 +328,136 @@ class BusStopWithStatistics:
 
 
 
-def merge_arrivals_into_corresponding_bus_stops(
+MINUTES_PER_DAY: int = 24 * 60
+
+
+@dataclass(init=True, repr=False, eq=False, frozen=True, slots=True)
+class ArrivalFrames:
+    """
+    Number of arrivals at every stop in every time slot of the day,
+    used to animate bus service through the day.
+    Slots are in clock time: slot 0 starts at 00:00. Service after midnight
+    (24:xx in GTFS) wraps around into the first hour, see `minute_of_day`.
+    """
+
+    slot_length_in_minutes: int
+    # Row `i` of `arrivals` belongs to the stop with id `stop_ids[i]`.
+    stop_ids: list[str]
+    # Shape (number of stops, number of slots).
+    arrivals: numpy.ndarray
+
+    @property
+    def number_of_slots(self) -> int:
+        return MINUTES_PER_DAY // self.slot_length_in_minutes
+
+    def encode_sparse_rows(self) -> list[list[int]]:
+        """
+        Encodes each stop's row as flat `[gap, run_length, arrivals, gap, run_length, arrivals, ...]`
+        triples, one per run of consecutive slots with the same non-zero number of arrivals.
+        `gap` is the number of empty slots between the end of the previous run
+        (or the start of the day) and the start of this run.
+        """
+
+        encoded_rows: list[list[int]] = []
+
+        for row in self.arrivals:
+            run_starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(row)) + 1))
+            run_lengths = numpy.diff(numpy.concatenate((run_starts, [row.size])))
+            run_values = row[run_starts]
+
+            is_non_empty = run_values != 0
+            run_starts = run_starts[is_non_empty]
+            run_lengths = run_lengths[is_non_empty]
+            run_values = run_values[is_non_empty]
+
+            previous_run_ends = numpy.concatenate(([0], (run_starts + run_lengths)[:-1]))
+
+            encoded_rows.append(
+                numpy.column_stack((run_starts - previous_run_ends, run_lengths, run_values))
+                .ravel()
+                .tolist()
+            )
+
+        return encoded_rows
+
+    def encode_dense_matrix(self) -> str:
+        """
+        :return: base64 of the row-major little-endian uint16 matrix (for a `Uint16Array` on the frontend)
+        """
+        return base64.b64encode(self.arrivals.astype("<u2").tobytes()).decode("ascii")
+
+    def serialize(self, encoding: str) -> dict:
+        if encoding == "sparse":
+            encoded_arrivals = self.encode_sparse_rows()
+        elif encoding == "dense":
+            encoded_arrivals = self.encode_dense_matrix()
+        else:
+            raise RuntimeError(f"Unknown arrival frame encoding: {encoding}")
+
+        return {
+            "slot_length_in_minutes": self.slot_length_in_minutes,
+            "number_of_slots": self.number_of_slots,
+            "stop_ids": self.stop_ids,
+            "encoding": encoding,
+            "arrivals": encoded_arrivals
+        }
+
+
+def minute_of_day(time_of_day: TimeOfDay) -> int:
+    """
+    :return: minute of the day in clock time (0 is 00:00)
+    """
+
+    # `TimeOfDay` stores the clock hour minus one (24:xx is stored as 23), see
+    # `TimeOfDay.from_colon_separated_hms`. It also accepts minute 60, which is kept within its hour.
+    # GTFS writes service after midnight as 24:xx, which wraps around to 00:xx, the clock time the buses
+    # actually run at. `TimeOfDay` rejects 00:xx itself, so the first hour only ever holds this late service.
+    clock_hour = (time_of_day.hour + 1) % 24
+    return clock_hour * 60 + min(time_of_day.minute, 59)
+
+
+def merge_arrivals_per_minute_into_corresponding_bus_stops(
     bus_stops: list[BusStop],
-    arrivals: list[BusArrival]
+    arrivals_per_minute: numpy.ndarray
 ) -> list[BusStopWithStatistics]:
-    bus_stops_by_id: dict[str, BusStopWithStatistics] = {
-        stop.id: BusStopWithStatistics(
+    """
+    :param arrivals_per_minute: matrix of shape (number of stops, minutes per day), in the same stop order as `bus_stops`
+    """
+
+    # Minutes are in clock time (see `minute_of_day`), so hour `i` holds arrivals from `i`:00 to `i`:59.
+    arrivals_per_hour = arrivals_per_minute.reshape(len(bus_stops), 24, 60).sum(axis=2)
+
+    stops_with_arrivals: list[BusStopWithStatistics] = []
+    for stop, stop_arrivals_per_hour in zip(bus_stops, arrivals_per_hour.tolist()):
+        arrivals_per_hour_of_day = ArrivalsPerHourOfDay()
+        arrivals_per_hour_of_day.arrivals = stop_arrivals_per_hour
+
+        stops_with_arrivals.append(BusStopWithStatistics(
             id=stop.id,
             code=stop.code,
             name=stop.name,
             location=stop.location,
-            arrivals_per_hour=ArrivalsPerHourOfDay()
-        )
-        for stop in bus_stops
-    }
-
-    for arrival in arrivals:
-        corresponding_bus_stop = bus_stops_by_id[arrival.stop_id]
-        corresponding_bus_stop.arrivals_per_hour.increment_by_one(arrival.arrival_time)
-
-    return [
-        stop_with_arrival
-        for stop_with_arrival in bus_stops_by_id.values()
-    ]
+            arrivals_per_hour=arrivals_per_hour_of_day
+        ))
+
+    return stops_with_arrivals
+
+
+def build_arrival_frames_from_arrivals_per_minute(
+    stop_ids: list[str],
+    arrivals_per_minute: numpy.ndarray,
+    slot_length_in_minutes: int
+) -> ArrivalFrames:
+    if slot_length_in_minutes <= 0 or MINUTES_PER_DAY % slot_length_in_minutes != 0:
+        raise RuntimeError("Slot length must evenly divide a day.")
+
+    number_of_slots = MINUTES_PER_DAY // slot_length_in_minutes
+    arrivals_per_slot = arrivals_per_minute.reshape(
+        len(stop_ids), number_of_slots, slot_length_in_minutes
+    ).sum(axis=2)
+
+    return ArrivalFrames(
+        slot_length_in_minutes=slot_length_in_minutes,
+        stop_ids=stop_ids,
+        arrivals=arrivals_per_slot.astype(numpy.uint16)
+    )
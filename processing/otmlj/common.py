@@ -1,4 +1,11 @@
+import math
 from dataclasses import dataclass
+from typing import Optional
+
+import numpy
+
+
+METRES_PER_DEGREE_OF_LATITUDE: float = 111_320.0
 
 
 @dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
@@ -8,3 +15,127 @@ class LatitudeLongitude:
 
     def serialize(self) -> tuple[float, float]:
         return self.latitude, self.longitude
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class LocalMetricProjection:
+    """
+    Equirectangular projection around a reference latitude, mapping coordinates
+    to (east, north) metres. Over an area the size of the Ljubljana region its error
+    is well below a percent, which is plenty for distance thresholds and tolerances.
+    """
+
+    reference_latitude: float
+
+    @classmethod
+    def around_points(cls, points: list[LatitudeLongitude]):
+        return LocalMetricProjection(
+            reference_latitude=sum(point.latitude for point in points) / len(points)
+        )
+
+    def metres_per_degree_of_longitude(self) -> float:
+        return METRES_PER_DEGREE_OF_LATITUDE * math.cos(math.radians(self.reference_latitude))
+
+    def project(
+        self,
+        latitudes: numpy.ndarray,
+        longitudes: numpy.ndarray
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        :return: east and north coordinates in metres
+        """
+        return (
+            numpy.asarray(longitudes, dtype=numpy.float64) * self.metres_per_degree_of_longitude(),
+            numpy.asarray(latitudes, dtype=numpy.float64) * METRES_PER_DEGREE_OF_LATITUDE
+        )
+
+    def unproject(
+        self,
+        east_metres: numpy.ndarray,
+        north_metres: numpy.ndarray
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        :return: latitudes and longitudes
+        """
+        return (
+            numpy.asarray(north_metres, dtype=numpy.float64) / METRES_PER_DEGREE_OF_LATITUDE,
+            numpy.asarray(east_metres, dtype=numpy.float64) / self.metres_per_degree_of_longitude()
+        )
+
+
+class SpatialHashGrid:
+    """
+    Buckets points (in metres) into square cells so that all points within
+    `cell_size` of a location can be found by looking at the 3x3 surrounding cells.
+    """
+
+    cell_size: float
+    east_metres: list[float]
+    north_metres: list[float]
+    cells: dict[tuple[int, int], list[int]]
+
+    def __init__(self, east_metres: numpy.ndarray, north_metres: numpy.ndarray, cell_size: float):
+        if cell_size <= 0:
+            raise RuntimeError("Spatial hash cell size must be positive.")
+
+        self.cell_size = cell_size
+        # Plain lists are much faster than numpy arrays for indexing single items.
+        self.east_metres = numpy.asarray(east_metres, dtype=numpy.float64).tolist()
+        self.north_metres = numpy.asarray(north_metres, dtype=numpy.float64).tolist()
+        self.cells = {}
+
+        cell_columns = numpy.floor(east_metres / cell_size).astype(numpy.int64).tolist()
+        cell_rows = numpy.floor(north_metres / cell_size).astype(numpy.int64).tolist()
+
+        for point_index, cell in enumerate(zip(cell_columns, cell_rows)):
+            self.cells.setdefault(cell, []).append(point_index)
+
+    def indices_within(self, east: float, north: float, radius: float) -> list[int]:
+        """
+        :return: indices of all points at most `radius` (<= `cell_size`) metres away
+        """
+
+        if radius > self.cell_size:
+            raise RuntimeError("Search radius must not exceed the spatial hash cell size.")
+
+        cell_column = int(math.floor(east / self.cell_size))
+        cell_row = int(math.floor(north / self.cell_size))
+
+        found_indices: list[int] = []
+        for column_offset in (-1, 0, 1):
+            for row_offset in (-1, 0, 1):
+                for point_index in self.cells.get((cell_column + column_offset, cell_row + row_offset), ()):
+                    distance = math.hypot(
+                        self.east_metres[point_index] - east,
+                        self.north_metres[point_index] - north
+                    )
+
+                    if distance <= radius:
+                        found_indices.append(point_index)
+
+        return found_indices
+
+    def nearest_within(self, east: float, north: float, radius: float) -> Optional[tuple[int, float]]:
+        """
+        :return: index of and distance to the nearest point at most `radius` metres away, if any
+        """
+
+        if radius > self.cell_size:
+            raise RuntimeError("Search radius must not exceed the spatial hash cell size.")
+
+        cell_column = int(math.floor(east / self.cell_size))
+        cell_row = int(math.floor(north / self.cell_size))
+
+        nearest: Optional[tuple[int, float]] = None
+        for column_offset in (-1, 0, 1):
+            for row_offset in (-1, 0, 1):
+                for point_index in self.cells.get((cell_column + column_offset, cell_row + row_offset), ()):
+                    distance = math.hypot(
+                        self.east_metres[point_index] - east,
+                        self.north_metres[point_index] - north
+                    )
+
+                    if distance <= radius and (nearest is None or distance < nearest[1]):
+                        nearest = (point_index, distance)
+
+        return nearest
@@ -0,0 +1,390 @@
+import hashlib
+import io
+import zipfile
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+import numpy
+import shapely
+from shapely import Polygon
+
+from otmlj.avtobusi import parse_bus_stops_from_raw_csv_data, merge_arrivals_per_minute_into_corresponding_bus_stops, \
+    find_first_service_date_on_weekday, find_service_ids_active_on_date, find_trip_ids_active_on_date
+from otmlj.common import LatitudeLongitude, LocalMetricProjection, SpatialHashGrid
+from otmlj.parallel_parsing import count_arrivals_per_minute_in_feed
+
+
+# Bump whenever the parsing or the cached arrays change, so that old caches are ignored.
+PARSED_FEED_CACHE_VERSION: int = 2
+
+
+@dataclass(init=True, repr=False, eq=False, frozen=True, slots=True)
+class ParsedFeed:
+    """
+    Stops and their arrivals per hour on one service day of a GTFS feed, as column arrays.
+    """
+
+    feed_name: str
+    service_date: date
+
+    # Shape (number of stops,).
+    stop_ids: numpy.ndarray
+    stop_codes: numpy.ndarray
+    stop_names: numpy.ndarray
+    stop_latitudes: numpy.ndarray
+    stop_longitudes: numpy.ndarray
+    # Shape (number of stops, 24).
+    arrivals_per_hour: numpy.ndarray
+
+    @property
+    def number_of_stops(self) -> int:
+        return int(self.stop_ids.size)
+
+
+def read_optional_feed_file(feed_zip: zipfile.ZipFile, file_name: str) -> Optional[str]:
+    if file_name not in feed_zip.namelist():
+        return None
+
+    return feed_zip.open(file_name, mode="r").read().decode("utf8")
+
+
+def parse_feed_for_weekday(
+    feed_zip_path: Path,
+    weekday: int,
+    number_of_workers: Optional[int] = None
+) -> ParsedFeed:
+    feed_zip = zipfile.ZipFile(feed_zip_path, mode="r")
+
+    raw_calendar_csv_data = read_optional_feed_file(feed_zip, "calendar.txt")
+    raw_calendar_dates_csv_data = read_optional_feed_file(feed_zip, "calendar_dates.txt")
+
+    service_date = find_first_service_date_on_weekday(
+        raw_calendar_csv_data,
+        raw_calendar_dates_csv_data,
+        weekday
+    )
+    active_trip_ids = find_trip_ids_active_on_date(
+        feed_zip.open("trips.txt", mode="r").read().decode("utf8"),
+        find_service_ids_active_on_date(raw_calendar_csv_data, raw_calendar_dates_csv_data, service_date)
+    )
+
+    stops = parse_bus_stops_from_raw_csv_data(
+        feed_zip.open("stops.txt", mode="r").read().decode("utf8")
+    )
+    arrivals_per_minute = count_arrivals_per_minute_in_feed(
+        feed_zip,
+        [stop.id for stop in stops],
+        active_trip_ids=active_trip_ids,
+        number_of_workers=number_of_workers
+    )
+
+    stops_with_arrivals = merge_arrivals_per_minute_into_corresponding_bus_stops(stops, arrivals_per_minute)
+
+    return ParsedFeed(
+        feed_name=feed_zip_path.name,
+        service_date=service_date,
+        stop_ids=numpy.array([stop.id for stop in stops_with_arrivals], dtype=numpy.str_),
+        stop_codes=numpy.array([stop.code for stop in stops_with_arrivals], dtype=numpy.int64),
+        stop_names=numpy.array([stop.name for stop in stops_with_arrivals], dtype=numpy.str_),
+        stop_latitudes=numpy.array([stop.location.latitude for stop in stops_with_arrivals], dtype=numpy.float64),
+        stop_longitudes=numpy.array([stop.location.longitude for stop in stops_with_arrivals], dtype=numpy.float64),
+        arrivals_per_hour=numpy.array(
+            [stop.arrivals_per_hour.arrivals for stop in stops_with_arrivals],
+            dtype=numpy.int64
+        ).reshape(len(stops_with_arrivals), 24)
+    )
+
+
+def load_feed_for_weekday(
+    feed_zip_path: Path,
+    weekday: int,
+    cache_directory_path: Path,
+    number_of_workers: Optional[int] = None
+) -> ParsedFeed:
+    """
+    Parses the feed, or loads it from the cache if this exact feed file
+    has already been parsed for the same weekday.
+    """
+
+    feed_hash = hashlib.sha256(feed_zip_path.read_bytes()).hexdigest()
+    cache_file_path = cache_directory_path / f"{feed_hash}_weekday-{weekday}_v{PARSED_FEED_CACHE_VERSION}.npz"
+
+    if cache_file_path.exists():
+        with numpy.load(cache_file_path, allow_pickle=False) as cached_arrays:
+            return ParsedFeed(
+                feed_name=feed_zip_path.name,
+                service_date=date.fromisoformat(str(cached_arrays["service_date"])),
+                stop_ids=cached_arrays["stop_ids"],
+                stop_codes=cached_arrays["stop_codes"],
+                stop_names=cached_arrays["stop_names"],
+                stop_latitudes=cached_arrays["stop_latitudes"],
+                stop_longitudes=cached_arrays["stop_longitudes"],
+                arrivals_per_hour=cached_arrays["arrivals_per_hour"]
+            )
+
+    parsed_feed = parse_feed_for_weekday(feed_zip_path, weekday, number_of_workers)
+
+    if not cache_directory_path.is_dir():
+        cache_directory_path.mkdir(parents=True)
+
+    # Written to memory first so an interrupted run never leaves a truncated cache file behind.
+    cache_buffer = io.BytesIO()
+    numpy.savez_compressed(
+        cache_buffer,
+        service_date=numpy.array(parsed_feed.service_date.isoformat()),
+        stop_ids=parsed_feed.stop_ids,
+        stop_codes=parsed_feed.stop_codes,
+        stop_names=parsed_feed.stop_names,
+        stop_latitudes=parsed_feed.stop_latitudes,
+        stop_longitudes=parsed_feed.stop_longitudes,
+        arrivals_per_hour=parsed_feed.arrivals_per_hour
+    )
+    cache_file_path.write_bytes(cache_buffer.getvalue())
+
+    return parsed_feed
+
+
+@dataclass(init=True, repr=False, eq=False, frozen=True, slots=True)
+class StopAlignment:
+    # Matched stops: `previous_indices[i]` in the previous feed is `next_indices[i]` in the next one.
+    previous_indices: numpy.ndarray
+    next_indices: numpy.ndarray
+    # Stops that only exist in one of the feeds.
+    removed_indices: numpy.ndarray
+    added_indices: numpy.ndarray
+
+
+def align_stops(
+    previous_feed: ParsedFeed,
+    next_feed: ParsedFeed,
+    maximum_location_distance_in_metres: float
+) -> StopAlignment:
+    """
+    Matches stops by id first, then by stop code, and finally
+    the remaining ones by nearest location within the given distance.
+    """
+
+    matched_next_indices = numpy.full(previous_feed.number_of_stops, -1, dtype=numpy.int64)
+    is_next_matched = numpy.zeros(next_feed.number_of_stops, dtype=bool)
+
+    for key_column_name in ("stop_ids", "stop_codes"):
+        next_indices_by_key: dict = {}
+        for next_index in numpy.flatnonzero(~is_next_matched).tolist():
+            # Duplicated keys are ambiguous and left to the later matching steps.
+            key = getattr(next_feed, key_column_name)[next_index].item()
+            next_indices_by_key[key] = -1 if key in next_indices_by_key else next_index
+
+        for previous_index in numpy.flatnonzero(matched_next_indices == -1).tolist():
+            key = getattr(previous_feed, key_column_name)[previous_index].item()
+            next_index = next_indices_by_key.get(key, -1)
+
+            if next_index != -1 and not is_next_matched[next_index]:
+                matched_next_indices[previous_index] = next_index
+                is_next_matched[next_index] = True
+
+
+    projection = LocalMetricProjection(reference_latitude=float(numpy.mean(previous_feed.stop_latitudes)))
+
+    unmatched_next_indices = numpy.flatnonzero(~is_next_matched)
+    next_east_metres, next_north_metres = projection.project(
+        next_feed.stop_latitudes[unmatched_next_indices],
+        next_feed.stop_longitudes[unmatched_next_indices]
+    )
+    unmatched_next_grid = SpatialHashGrid(
+        next_east_metres,
+        next_north_metres,
+        cell_size=maximum_location_distance_in_metres
+    )
+
+    unmatched_previous_indices = numpy.flatnonzero(matched_next_indices == -1)
+    previous_east_metres, previous_north_metres = projection.project(
+        previous_feed.stop_latitudes[unmatched_previous_indices],
+        previous_feed.stop_longitudes[unmatched_previous_indices]
+    )
+
+    for previous_index, east, north in zip(
+        unmatched_previous_indices.tolist(),
+        previous_east_metres.tolist(),
+        previous_north_metres.tolist()
+    ):
+        nearest = unmatched_next_grid.nearest_within(east, north, maximum_location_distance_in_metres)
+        if nearest is None:
+            continue
+
+        next_index = int(unmatched_next_indices[nearest[0]])
+        if not is_next_matched[next_index]:
+            matched_next_indices[previous_index] = next_index
+            is_next_matched[next_index] = True
+
+
+    is_previous_matched = matched_next_indices != -1
+
+    return StopAlignment(
+        previous_indices=numpy.flatnonzero(is_previous_matched),
+        next_indices=matched_next_indices[is_previous_matched],
+        removed_indices=numpy.flatnonzero(~is_previous_matched),
+        added_indices=numpy.flatnonzero(~is_next_matched)
+    )
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class StopArrivalsChange:
+    stop_id: str
+    name: str
+    location: LatitudeLongitude
+    # "changed", "added" or "removed".
+    status: str
+    previous_arrivals_per_hour: list[int]
+    next_arrivals_per_hour: list[int]
+
+    def serialize(self) -> dict:
+        return {
+            "stop_id": self.stop_id,
+            "name": self.name,
+            "location": self.location.serialize(),
+            "status": self.status,
+            "previous_arrivals_per_hour": self.previous_arrivals_per_hour,
+            "next_arrivals_per_hour": self.next_arrivals_per_hour,
+            "change_per_hour": [
+                next_arrivals - previous_arrivals
+                for previous_arrivals, next_arrivals in zip(
+                    self.previous_arrivals_per_hour,
+                    self.next_arrivals_per_hour
+                )
+            ]
+        }
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class ZoneArrivalsChange:
+    zone_name: str
+    previous_arrivals_per_hour: list[int]
+    next_arrivals_per_hour: list[int]
+
+    def serialize(self) -> dict:
+        return {
+            "zone_name": self.zone_name,
+            "previous_arrivals_per_hour": self.previous_arrivals_per_hour,
+            "next_arrivals_per_hour": self.next_arrivals_per_hour,
+            "previous_total_arrivals": sum(self.previous_arrivals_per_hour),
+            "next_total_arrivals": sum(self.next_arrivals_per_hour)
+        }
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class FeedComparison:
+    previous_feed_name: str
+    previous_service_date: date
+    next_feed_name: str
+    next_service_date: date
+    number_of_matched_stops: int
+    stop_changes: list[StopArrivalsChange]
+    zone_changes: list[ZoneArrivalsChange]
+
+    def serialize(self) -> dict:
+        return {
+            "previous_feed_name": self.previous_feed_name,
+            "previous_service_date": self.previous_service_date.isoformat(),
+            "next_feed_name": self.next_feed_name,
+            "next_service_date": self.next_service_date.isoformat(),
+            "number_of_matched_stops": self.number_of_matched_stops,
+            "stop_changes": [
+                stop_change.serialize()
+                for stop_change in self.stop_changes
+            ],
+            "zone_changes": [
+                zone_change.serialize()
+                for zone_change in self.zone_changes
+            ]
+        }
+
+
+def compare_feeds(
+    previous_feed: ParsedFeed,
+    next_feed: ParsedFeed,
+    zones: list[tuple[str, list[LatitudeLongitude]]],
+    maximum_location_distance_in_metres: float
+) -> FeedComparison:
+    """
+    Compares arrivals per hour of two feeds. Only stops whose arrivals changed are
+    listed, with stops present in just one of the feeds reported as added or removed.
+    """
+
+    alignment = align_stops(previous_feed, next_feed, maximum_location_distance_in_metres)
+
+    previous_aligned_arrivals = previous_feed.arrivals_per_hour[alignment.previous_indices]
+    next_aligned_arrivals = next_feed.arrivals_per_hour[alignment.next_indices]
+    is_changed = numpy.any(previous_aligned_arrivals != next_aligned_arrivals, axis=1)
+
+    stop_changes: list[StopArrivalsChange] = []
+
+    for previous_index, next_index in zip(
+        alignment.previous_indices[is_changed].tolist(),
+        alignment.next_indices[is_changed].tolist()
+    ):
+        stop_changes.append(StopArrivalsChange(
+            stop_id=str(next_feed.stop_ids[next_index]),
+            name=str(next_feed.stop_names[next_index]),
+            location=LatitudeLongitude(
+                latitude=float(next_feed.stop_latitudes[next_index]),
+                longitude=float(next_feed.stop_longitudes[next_index])
+            ),
+            status="changed",
+            previous_arrivals_per_hour=previous_feed.arrivals_per_hour[previous_index].tolist(),
+            next_arrivals_per_hour=next_feed.arrivals_per_hour[next_index].tolist()
+        ))
+
+    for feed, indices, status in (
+        (previous_feed, alignment.removed_indices, "removed"),
+        (next_feed, alignment.added_indices, "added")
+    ):
+        for index in indices.tolist():
+            arrivals_per_hour = feed.arrivals_per_hour[index].tolist()
+
+            stop_changes.append(StopArrivalsChange(
+                stop_id=str(feed.stop_ids[index]),
+                name=str(feed.stop_names[index]),
+                location=LatitudeLongitude(
+                    latitude=float(feed.stop_latitudes[index]),
+                    longitude=float(feed.stop_longitudes[index])
+                ),
+                status=status,
+                previous_arrivals_per_hour=arrivals_per_hour if status == "removed" else [0] * 24,
+                next_arrivals_per_hour=arrivals_per_hour if status == "added" else [0] * 24
+            ))
+
+
+    zone_changes: list[ZoneArrivalsChange] = []
+
+    for zone_name, zone_bounds in zones:
+        # Same coordinate order as in `parse_green_zone_GeoJSON_polygon`: x is latitude.
+        zone_polygon = Polygon([
+            (point.latitude, point.longitude)
+            for point in zone_bounds
+        ])
+
+        is_previous_inside = shapely.contains_xy(
+            zone_polygon, previous_feed.stop_latitudes, previous_feed.stop_longitudes
+        )
+        is_next_inside = shapely.contains_xy(
+            zone_polygon, next_feed.stop_latitudes, next_feed.stop_longitudes
+        )
+
+        zone_changes.append(ZoneArrivalsChange(
+            zone_name=zone_name,
+            previous_arrivals_per_hour=previous_feed.arrivals_per_hour[is_previous_inside].sum(axis=0).tolist(),
+            next_arrivals_per_hour=next_feed.arrivals_per_hour[is_next_inside].sum(axis=0).tolist()
+        ))
+
+
+    return FeedComparison(
+        previous_feed_name=previous_feed.feed_name,
+        previous_service_date=previous_feed.service_date,
+        next_feed_name=next_feed.feed_name,
+        next_service_date=next_feed.service_date,
+        number_of_matched_stops=int(alignment.previous_indices.size),
+        stop_changes=stop_changes,
+        zone_changes=zone_changes
+    )
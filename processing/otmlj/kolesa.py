@@ -1,7 +1,16 @@
+import heapq
 import json
+import math
+from collections import deque
 from dataclasses import dataclass
+from typing import Optional
 
-from otmlj.common import LatitudeLongitude
+import numpy
+import shapely
+from shapely import STRtree
+from shapely.ops import substring
+
+from otmlj.common import LatitudeLongitude, LocalMetricProjection, SpatialHashGrid
 
 
 @dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
@@ -79,3 +88,610 @@ def parse_bike_lanes_from_WGS84_GeoJSON(
 
 
     return parsed_bike_lanes, total_length_in_metres
+
+
+
+def project_bike_lanes_to_metric_line_strings(
+    bike_lanes: list[BikeLaneMultiLine],
+    projection: LocalMetricProjection
+) -> numpy.ndarray:
+    """
+    :return: array of shapely LineStrings (one per lane) with coordinates in metres
+    """
+
+    latitudes = numpy.array(
+        [point.latitude for lane in bike_lanes for point in lane.line_points],
+        dtype=numpy.float64
+    )
+    longitudes = numpy.array(
+        [point.longitude for lane in bike_lanes for point in lane.line_points],
+        dtype=numpy.float64
+    )
+    lane_indices = numpy.repeat(
+        numpy.arange(len(bike_lanes)),
+        [len(lane.line_points) for lane in bike_lanes]
+    )
+
+    east_metres, north_metres = projection.project(latitudes, longitudes)
+
+    return shapely.linestrings(east_metres, north_metres, indices=lane_indices)
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class BikeLaneSimplificationReport:
+    lanes_before: int
+    lanes_after: int
+    vertices_before: int
+    vertices_after: int
+    serialized_bytes_before: int
+    serialized_bytes_after: int
+
+    def describe(self) -> str:
+        return (
+            f"{self.lanes_before} -> {self.lanes_after} lanes, "
+            f"{self.vertices_before} -> {self.vertices_after} vertices, "
+            f"{self.serialized_bytes_before} -> {self.serialized_bytes_after} bytes "
+            f"({round(self.serialized_bytes_before / max(self.serialized_bytes_after, 1), 1)}x smaller)"
+        )
+
+
+def serialized_size_of_bike_lanes_in_bytes(bike_lanes: list[BikeLaneMultiLine]) -> int:
+    # Matches the formatting used when exporting the visualization data.
+    return len(json.dumps(
+        [lane.serialize_as_dict() for lane in bike_lanes],
+        indent=2,
+        ensure_ascii=False
+    ).encode("utf8"))
+
+
+def simplify_bike_lanes(
+    bike_lanes: list[BikeLaneMultiLine],
+    tolerance_in_metres: float,
+    coordinate_decimal_places: int
+) -> tuple[list[BikeLaneMultiLine], BikeLaneSimplificationReport]:
+    """
+    Merges lanes that share endpoints into longer chains, simplifies them
+    without introducing new intersections and quantizes the coordinates.
+
+    :return: simplified bike lanes and a report of how much smaller they are
+    """
+
+    all_points = [point for lane in bike_lanes for point in lane.line_points]
+    projection = LocalMetricProjection.around_points(all_points)
+
+    metric_lines = project_bike_lanes_to_metric_line_strings(bike_lanes, projection)
+
+    # `line_merge` joins lines meeting at nodes of degree two, i.e. it never
+    # merges through an intersection, so the network topology is kept.
+    merged_network = shapely.line_merge(shapely.multilinestrings(metric_lines))
+
+    # The whole network is simplified at once so the simplifier can
+    # prevent chains from being moved across one another.
+    simplified_network = shapely.simplify(
+        merged_network,
+        tolerance=tolerance_in_metres,
+        preserve_topology=True
+    )
+
+    simplified_chains = shapely.get_parts(simplified_network)
+    metric_coordinates, chain_indices = shapely.get_coordinates(simplified_chains, return_index=True)
+
+    latitudes, longitudes = projection.unproject(metric_coordinates[:, 0], metric_coordinates[:, 1])
+    latitudes = numpy.round(latitudes, coordinate_decimal_places)
+    longitudes = numpy.round(longitudes, coordinate_decimal_places)
+
+    # Quantization can collapse neighbouring vertices into one, so drop consecutive duplicates.
+    is_kept = numpy.ones(latitudes.size, dtype=bool)
+    is_kept[1:] = (
+        (chain_indices[1:] != chain_indices[:-1])
+        | (latitudes[1:] != latitudes[:-1])
+        | (longitudes[1:] != longitudes[:-1])
+    )
+
+    latitudes = latitudes[is_kept]
+    longitudes = longitudes[is_kept]
+    chain_indices = chain_indices[is_kept]
+
+    chain_boundaries = numpy.flatnonzero(numpy.diff(chain_indices)) + 1
+    chain_starts = numpy.concatenate(([0], chain_boundaries))
+    chain_ends = numpy.concatenate((chain_boundaries, [latitudes.size]))
+
+    latitude_list = latitudes.tolist()
+    longitude_list = longitudes.tolist()
+
+    simplified_bike_lanes: list[BikeLaneMultiLine] = []
+    for chain_start, chain_end in zip(chain_starts.tolist(), chain_ends.tolist()):
+        if chain_end - chain_start < 2:
+            continue
+
+        simplified_bike_lanes.append(BikeLaneMultiLine(line_points=[
+            LatitudeLongitude(latitude=latitude, longitude=longitude)
+            for latitude, longitude in zip(
+                latitude_list[chain_start:chain_end],
+                longitude_list[chain_start:chain_end]
+            )
+        ]))
+
+
+    report = BikeLaneSimplificationReport(
+        lanes_before=len(bike_lanes),
+        lanes_after=len(simplified_bike_lanes),
+        vertices_before=len(all_points),
+        vertices_after=sum(len(lane.line_points) for lane in simplified_bike_lanes),
+        serialized_bytes_before=serialized_size_of_bike_lanes_in_bytes(bike_lanes),
+        serialized_bytes_after=serialized_size_of_bike_lanes_in_bytes(simplified_bike_lanes)
+    )
+
+    return simplified_bike_lanes, report
+
+
+
+@dataclass(init=True, repr=False, eq=False, frozen=True, slots=True)
+class BikeNetworkGraph:
+    """
+    Bike lanes as an undirected graph: lane endpoints lying within the snapping
+    tolerance of each other become a single node and every lane becomes an edge.
+    Lanes are first split wherever another lane ends on them, so T-junctions are nodes too.
+    Adjacency is stored in compressed sparse row form, with each edge listed once
+    from each of its two nodes.
+    """
+
+    projection: LocalMetricProjection
+
+    # Shape (number of nodes,).
+    node_east_metres: numpy.ndarray
+    node_north_metres: numpy.ndarray
+
+    # Shape (number of edges,).
+    edge_lines: numpy.ndarray
+    edge_from_nodes: numpy.ndarray
+    edge_to_nodes: numpy.ndarray
+    edge_lengths_in_metres: numpy.ndarray
+
+    # Neighbours of node `n` are `adjacency_neighbours[adjacency_offsets[n]:adjacency_offsets[n + 1]]`.
+    adjacency_offsets: numpy.ndarray
+    adjacency_neighbours: numpy.ndarray
+    adjacency_edges: numpy.ndarray
+
+    @property
+    def number_of_nodes(self) -> int:
+        return int(self.node_east_metres.size)
+
+    @property
+    def number_of_edges(self) -> int:
+        return int(self.edge_from_nodes.size)
+
+    def node_location(self, node: int) -> LatitudeLongitude:
+        latitude, longitude = self.projection.unproject(
+            self.node_east_metres[node],
+            self.node_north_metres[node]
+        )
+
+        return LatitudeLongitude(latitude=float(latitude), longitude=float(longitude))
+
+
+def split_lines_where_other_lines_end(
+    metric_lines: numpy.ndarray,
+    snapping_tolerance_in_metres: float
+) -> numpy.ndarray:
+    """
+    Splits every line at the points closest to other lines' endpoints lying within
+    the snapping tolerance of it, so that lanes ending on the middle of another
+    lane (T-junctions) share a vertex with it.
+
+    :return: array of shapely LineStrings, the pieces of all lines
+    """
+
+    endpoints = numpy.concatenate((
+        shapely.get_point(metric_lines, 0),
+        shapely.get_point(metric_lines, -1)
+    ))
+    endpoint_lines = numpy.concatenate((numpy.arange(metric_lines.size), numpy.arange(metric_lines.size)))
+
+    endpoint_indices, line_indices = STRtree(metric_lines).query(
+        endpoints,
+        predicate="dwithin",
+        distance=snapping_tolerance_in_metres
+    )
+
+    is_other_line = endpoint_lines[endpoint_indices] != line_indices
+    endpoint_indices = endpoint_indices[is_other_line]
+    line_indices = line_indices[is_other_line]
+
+    split_distances = shapely.line_locate_point(metric_lines[line_indices], endpoints[endpoint_indices])
+    line_lengths = shapely.length(metric_lines)
+
+    # Endpoints near a line's own ends are joined by endpoint snapping, no split is needed there.
+    is_interior = (
+        (split_distances > snapping_tolerance_in_metres)
+        & (split_distances < line_lengths[line_indices] - snapping_tolerance_in_metres)
+    )
+
+    split_distances_by_line: dict[int, set[float]] = {}
+    for line_index, split_distance in zip(line_indices[is_interior].tolist(), split_distances[is_interior].tolist()):
+        split_distances_by_line.setdefault(line_index, set()).add(split_distance)
+
+
+    line_pieces: list = []
+    for line_index, line in enumerate(metric_lines.tolist()):
+        if line_index not in split_distances_by_line:
+            line_pieces.append(line)
+            continue
+
+        piece_boundaries = [0.0] + sorted(split_distances_by_line[line_index]) + [float(line_lengths[line_index])]
+        for piece_start, piece_end in zip(piece_boundaries[:-1], piece_boundaries[1:]):
+            line_pieces.append(substring(line, piece_start, piece_end))
+
+    return numpy.array(line_pieces, dtype=object)
+
+
+def build_bike_network_graph(
+    bike_lanes: list[BikeLaneMultiLine],
+    snapping_tolerance_in_metres: float
+) -> BikeNetworkGraph:
+    projection = LocalMetricProjection.around_points(
+        [point for lane in bike_lanes for point in lane.line_points]
+    )
+
+    edge_lines = split_lines_where_other_lines_end(
+        project_bike_lanes_to_metric_line_strings(bike_lanes, projection),
+        snapping_tolerance_in_metres
+    )
+    edge_lengths = shapely.length(edge_lines)
+
+    # Endpoint 2 * i is the start and 2 * i + 1 the end of edge i.
+    endpoint_coordinates = numpy.empty((2 * edge_lines.size, 2), dtype=numpy.float64)
+    endpoint_coordinates[0::2] = shapely.get_coordinates(shapely.get_point(edge_lines, 0))
+    endpoint_coordinates[1::2] = shapely.get_coordinates(shapely.get_point(edge_lines, -1))
+
+    endpoint_grid = SpatialHashGrid(
+        endpoint_coordinates[:, 0],
+        endpoint_coordinates[:, 1],
+        cell_size=snapping_tolerance_in_metres
+    )
+
+
+    # Union-find over endpoints that are close enough to be snapped together.
+    endpoint_parents = list(range(len(endpoint_coordinates)))
+
+    def find_root(endpoint: int) -> int:
+        while endpoint_parents[endpoint] != endpoint:
+            endpoint_parents[endpoint] = endpoint_parents[endpoint_parents[endpoint]]
+            endpoint = endpoint_parents[endpoint]
+
+        return endpoint
+
+    for endpoint, (east, north) in enumerate(endpoint_coordinates.tolist()):
+        for nearby_endpoint in endpoint_grid.indices_within(east, north, snapping_tolerance_in_metres):
+            endpoint_root = find_root(endpoint)
+            nearby_root = find_root(nearby_endpoint)
+
+            if endpoint_root != nearby_root:
+                endpoint_parents[nearby_root] = endpoint_root
+
+    endpoint_roots = numpy.array(
+        [find_root(endpoint) for endpoint in range(len(endpoint_coordinates))],
+        dtype=numpy.int64
+    )
+    _, endpoint_nodes = numpy.unique(endpoint_roots, return_inverse=True)
+    number_of_nodes = int(endpoint_nodes.max()) + 1 if endpoint_nodes.size > 0 else 0
+
+    # Each node is placed at the centroid of the endpoints snapped into it.
+    endpoints_per_node = numpy.bincount(endpoint_nodes, minlength=number_of_nodes)
+    node_east_metres = numpy.bincount(
+        endpoint_nodes, weights=endpoint_coordinates[:, 0], minlength=number_of_nodes
+    ) / endpoints_per_node
+    node_north_metres = numpy.bincount(
+        endpoint_nodes, weights=endpoint_coordinates[:, 1], minlength=number_of_nodes
+    ) / endpoints_per_node
+
+
+    edge_from_nodes = endpoint_nodes[0::2]
+    edge_to_nodes = endpoint_nodes[1::2]
+
+    arc_sources = numpy.concatenate((edge_from_nodes, edge_to_nodes))
+    arc_targets = numpy.concatenate((edge_to_nodes, edge_from_nodes))
+    arc_edges = numpy.concatenate((numpy.arange(edge_lines.size), numpy.arange(edge_lines.size)))
+
+    arc_order = numpy.argsort(arc_sources, kind="stable")
+    adjacency_offsets = numpy.zeros(number_of_nodes + 1, dtype=numpy.int64)
+    adjacency_offsets[1:] = numpy.cumsum(numpy.bincount(arc_sources, minlength=number_of_nodes))
+
+    return BikeNetworkGraph(
+        projection=projection,
+        node_east_metres=node_east_metres,
+        node_north_metres=node_north_metres,
+        edge_lines=edge_lines,
+        edge_from_nodes=edge_from_nodes,
+        edge_to_nodes=edge_to_nodes,
+        edge_lengths_in_metres=edge_lengths,
+        adjacency_offsets=adjacency_offsets,
+        adjacency_neighbours=arc_targets[arc_order],
+        adjacency_edges=arc_edges[arc_order]
+    )
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class BikeNetworkComponent:
+    number_of_nodes: int
+    number_of_edges: int
+    length_in_metres: float
+
+    def serialize(self) -> dict:
+        return {
+            "number_of_nodes": self.number_of_nodes,
+            "number_of_edges": self.number_of_edges,
+            "length_in_metres": self.length_in_metres
+        }
+
+
+def find_connected_components(
+    graph: BikeNetworkGraph
+) -> tuple[numpy.ndarray, list[BikeNetworkComponent]]:
+    """
+    :return: component index of every node, and the components sorted from longest to shortest
+    """
+
+    adjacency_offsets = graph.adjacency_offsets.tolist()
+    adjacency_neighbours = graph.adjacency_neighbours.tolist()
+
+    node_components = [-1] * graph.number_of_nodes
+    number_of_components = 0
+
+    for start_node in range(graph.number_of_nodes):
+        if node_components[start_node] != -1:
+            continue
+
+        node_components[start_node] = number_of_components
+        nodes_to_visit = deque([start_node])
+
+        while nodes_to_visit:
+            node = nodes_to_visit.popleft()
+
+            for neighbour in adjacency_neighbours[adjacency_offsets[node]:adjacency_offsets[node + 1]]:
+                if node_components[neighbour] == -1:
+                    node_components[neighbour] = number_of_components
+                    nodes_to_visit.append(neighbour)
+
+        number_of_components += 1
+
+
+    node_components = numpy.array(node_components, dtype=numpy.int64)
+    edge_components = node_components[graph.edge_from_nodes]
+
+    nodes_per_component = numpy.bincount(node_components, minlength=number_of_components)
+    edges_per_component = numpy.bincount(edge_components, minlength=number_of_components)
+    length_per_component = numpy.bincount(
+        edge_components,
+        weights=graph.edge_lengths_in_metres,
+        minlength=number_of_components
+    )
+
+    # Renumber components so that component 0 is the longest one.
+    component_order = numpy.argsort(-length_per_component, kind="stable")
+    component_renumbering = numpy.empty_like(component_order)
+    component_renumbering[component_order] = numpy.arange(number_of_components)
+
+    components = [
+        BikeNetworkComponent(
+            number_of_nodes=int(nodes_per_component[component]),
+            number_of_edges=int(edges_per_component[component]),
+            length_in_metres=float(length_per_component[component])
+        )
+        for component in component_order.tolist()
+    ]
+
+    return component_renumbering[node_components], components
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class BikeNetworkGap:
+    # A lane end in `from_component` and the nearest point of a lane in `to_component`.
+    from_location: LatitudeLongitude
+    to_location: LatitudeLongitude
+    from_component: int
+    to_component: int
+    distance_in_metres: float
+
+    def serialize(self) -> dict:
+        return {
+            "from_location": self.from_location.serialize(),
+            "to_location": self.to_location.serialize(),
+            "from_component": self.from_component,
+            "to_component": self.to_component,
+            "distance_in_metres": self.distance_in_metres
+        }
+
+
+def find_gaps_between_components(
+    graph: BikeNetworkGraph,
+    node_components: numpy.ndarray,
+    maximum_gap_in_metres: float
+) -> list[BikeNetworkGap]:
+    """
+    Finds places where two disconnected parts of the network come close to each other:
+    a lane end (graph node) near any point of a lane in another component.
+    Only the shortest gap between each pair of components is reported.
+
+    :return: gaps sorted from shortest to longest
+    """
+
+    node_points = shapely.points(graph.node_east_metres, graph.node_north_metres)
+
+    # Every lane within the maximum gap of every node, in a single batched query.
+    candidate_nodes, candidate_edges = STRtree(graph.edge_lines).query(
+        node_points,
+        predicate="dwithin",
+        distance=maximum_gap_in_metres
+    )
+
+    candidate_node_components = node_components[candidate_nodes]
+    candidate_edge_components = node_components[graph.edge_from_nodes[candidate_edges]]
+
+    is_between_components = candidate_node_components != candidate_edge_components
+    candidate_nodes = candidate_nodes[is_between_components]
+    candidate_edges = candidate_edges[is_between_components]
+    candidate_node_components = candidate_node_components[is_between_components]
+    candidate_edge_components = candidate_edge_components[is_between_components]
+
+    # From the node to the nearest point of the lane, which may lie anywhere along it.
+    shortest_lines = shapely.shortest_line(node_points[candidate_nodes], graph.edge_lines[candidate_edges])
+    gap_distances = shapely.length(shortest_lines)
+    nearest_edge_points = shapely.get_coordinates(shortest_lines)[1::2]
+
+    shortest_gaps: dict[tuple[int, int], tuple[float, int]] = {}
+    for candidate_index, (node_component, edge_component, distance) in enumerate(zip(
+        candidate_node_components.tolist(),
+        candidate_edge_components.tolist(),
+        gap_distances.tolist()
+    )):
+        component_pair = (min(node_component, edge_component), max(node_component, edge_component))
+        if component_pair not in shortest_gaps or distance < shortest_gaps[component_pair][0]:
+            shortest_gaps[component_pair] = (distance, candidate_index)
+
+
+    nearest_edge_latitudes, nearest_edge_longitudes = graph.projection.unproject(
+        nearest_edge_points[:, 0],
+        nearest_edge_points[:, 1]
+    )
+
+    gaps = [
+        BikeNetworkGap(
+            from_location=graph.node_location(int(candidate_nodes[candidate_index])),
+            to_location=LatitudeLongitude(
+                latitude=float(nearest_edge_latitudes[candidate_index]),
+                longitude=float(nearest_edge_longitudes[candidate_index])
+            ),
+            from_component=int(candidate_node_components[candidate_index]),
+            to_component=int(candidate_edge_components[candidate_index]),
+            distance_in_metres=distance
+        )
+        for distance, candidate_index in shortest_gaps.values()
+    ]
+
+    return sorted(gaps, key=lambda gap: gap.distance_in_metres)
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class BikeNetworkReachability:
+    name: str
+    location: LatitudeLongitude
+    # None when there is no network node within the access distance.
+    distance_to_network_in_metres: Optional[float]
+    reachable_length_in_metres: float
+
+    def serialize(self) -> dict:
+        return {
+            "name": self.name,
+            "location": self.location.serialize(),
+            "distance_to_network_in_metres": self.distance_to_network_in_metres,
+            "reachable_length_in_metres": self.reachable_length_in_metres
+        }
+
+
+def compute_reachable_network_lengths(
+    graph: BikeNetworkGraph,
+    named_locations: list[tuple[str, LatitudeLongitude]],
+    access_distance_in_metres: float,
+    maximum_cycling_distance_in_metres: float
+) -> list[BikeNetworkReachability]:
+    """
+    For each location, enters the network at the nearest point of the nearest lane and
+    measures the total length of lanes that can be ridden within the given cycling distance
+    (the lane it enters on, plus every other lane that can be ridden fully).
+    """
+
+    adjacency_offsets = graph.adjacency_offsets.tolist()
+    adjacency_neighbours = graph.adjacency_neighbours.tolist()
+    adjacency_edges = graph.adjacency_edges.tolist()
+    edge_lengths = graph.edge_lengths_in_metres.tolist()
+    edge_from_nodes = graph.edge_from_nodes.tolist()
+    edge_to_nodes = graph.edge_to_nodes.tolist()
+
+    location_east_metres, location_north_metres = graph.projection.project(
+        [location.latitude for _, location in named_locations],
+        [location.longitude for _, location in named_locations]
+    )
+    location_points = shapely.points(location_east_metres, location_north_metres)
+
+    # Nearest lane of every location within the access distance, in a single batched query.
+    (nearest_location_indices, nearest_edges), nearest_distances = STRtree(graph.edge_lines).query_nearest(
+        location_points,
+        max_distance=access_distance_in_metres,
+        return_distance=True,
+        all_matches=False
+    )
+    entry_distances_along_edges = shapely.line_locate_point(
+        graph.edge_lines[nearest_edges],
+        location_points[nearest_location_indices]
+    )
+
+    entry_edges_by_location: dict[int, tuple[int, float, float]] = {
+        location_index: (edge, distance_to_network, distance_along_edge)
+        for location_index, edge, distance_to_network, distance_along_edge in zip(
+            nearest_location_indices.tolist(),
+            nearest_edges.tolist(),
+            nearest_distances.tolist(),
+            entry_distances_along_edges.tolist()
+        )
+    }
+
+    reachabilities: list[BikeNetworkReachability] = []
+    for location_index, (name, location) in enumerate(named_locations):
+        if location_index not in entry_edges_by_location:
+            reachabilities.append(BikeNetworkReachability(
+                name=name,
+                location=location,
+                distance_to_network_in_metres=None,
+                reachable_length_in_metres=0
+            ))
+            continue
+
+        entry_edge, distance_to_network, distance_along_entry_edge = entry_edges_by_location[location_index]
+
+        # Riding starts somewhere along the entry edge, towards either of its nodes.
+        node_distances: dict[int, float] = {}
+        node_queue: list[tuple[float, int]] = []
+        for entry_node, entry_node_distance in (
+            (edge_from_nodes[entry_edge], distance_along_entry_edge),
+            (edge_to_nodes[entry_edge], edge_lengths[entry_edge] - distance_along_entry_edge)
+        ):
+            if entry_node_distance <= maximum_cycling_distance_in_metres \
+                    and entry_node_distance < node_distances.get(entry_node, math.inf):
+                node_distances[entry_node] = entry_node_distance
+                heapq.heappush(node_queue, (entry_node_distance, entry_node))
+
+        settled_nodes: set[int] = set()
+        reachable_edges: set[int] = {entry_edge}
+
+        # Dijkstra's algorithm, cut off at the maximum cycling distance.
+        while node_queue:
+            node_distance, node = heapq.heappop(node_queue)
+            if node in settled_nodes:
+                continue
+
+            settled_nodes.add(node)
+
+            for arc in range(adjacency_offsets[node], adjacency_offsets[node + 1]):
+                edge = adjacency_edges[arc]
+                neighbour_distance = node_distance + edge_lengths[edge]
+
+                if neighbour_distance > maximum_cycling_distance_in_metres:
+                    continue
+
+                reachable_edges.add(edge)
+
+                neighbour = adjacency_neighbours[arc]
+                if neighbour_distance < node_distances.get(neighbour, math.inf):
+                    node_distances[neighbour] = neighbour_distance
+                    heapq.heappush(node_queue, (neighbour_distance, neighbour))
+
+
+        reachabilities.append(BikeNetworkReachability(
+            name=name,
+            location=location,
+            distance_to_network_in_metres=distance_to_network,
+            reachable_length_in_metres=sum(edge_lengths[edge] for edge in reachable_edges)
+        ))
+
+    return reachabilities
@@ -0,0 +1,148 @@
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy
+import shapely
+from shapely import STRtree
+
+from otmlj.avtobusi import BusStopWithStatistics
+from otmlj.common import LocalMetricProjection
+from otmlj.kolesa import BikeLaneMultiLine, project_bike_lanes_to_metric_line_strings
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class BusStopBikeConnectivity:
+    stop_id: str
+    # None when there are no bike lanes at all.
+    distance_to_nearest_bike_lane_in_metres: Optional[float]
+    bike_lane_length_within_radius_in_metres: float
+    # Between 0 (no bike lane within the radius) and 1 (a lane at the stop, with
+    # at least two radii worth of lanes around it), see `compute_connectivity_scores`.
+    connectivity_score: float
+
+    def serialize(self) -> dict:
+        return {
+            "stop_id": self.stop_id,
+            "distance_to_nearest_bike_lane_in_metres": self.distance_to_nearest_bike_lane_in_metres,
+            "bike_lane_length_within_radius_in_metres": self.bike_lane_length_within_radius_in_metres,
+            "connectivity_score": self.connectivity_score
+        }
+
+
+def split_bike_lanes_into_metric_segments(
+    bike_lanes: list[BikeLaneMultiLine],
+    projection: LocalMetricProjection
+) -> numpy.ndarray:
+    """
+    :return: array of two-point shapely LineStrings with coordinates in metres
+    """
+
+    metric_lines = project_bike_lanes_to_metric_line_strings(bike_lanes, projection)
+    metric_points, lane_indices = shapely.get_coordinates(metric_lines, return_index=True)
+
+    # A segment joins each point with the next one, unless the next one starts another lane.
+    segment_starts = numpy.flatnonzero(lane_indices[:-1] == lane_indices[1:])
+
+    return shapely.linestrings(
+        numpy.stack((metric_points[segment_starts], metric_points[segment_starts + 1]), axis=1)
+    )
+
+
+def compute_connectivity_scores(
+    nearest_distances_in_metres: numpy.ndarray,
+    lane_lengths_within_radius_in_metres: numpy.ndarray,
+    radius_in_metres: float
+) -> numpy.ndarray:
+    """
+    Averages how close the nearest lane is (1 at the stop, 0 at the radius) and how
+    much lane there is around the stop (1 for twice the radius, i.e. two lanes
+    straight through the stop, or more).
+
+    :param nearest_distances_in_metres: NaN for stops without a nearest lane
+    """
+
+    proximity = numpy.nan_to_num(
+        numpy.clip(1 - nearest_distances_in_metres / radius_in_metres, 0, 1),
+        nan=0
+    )
+    density = numpy.clip(lane_lengths_within_radius_in_metres / (2 * radius_in_metres), 0, 1)
+
+    return (proximity + density) / 2
+
+
+def join_bus_stops_with_bike_lanes(
+    bus_stops: list[BusStopWithStatistics],
+    bike_lanes: list[BikeLaneMultiLine],
+    radius_in_metres: float
+) -> list[BusStopBikeConnectivity]:
+    """
+    For every stop, finds the distance to the nearest bike lane and the length
+    of bike lanes within the radius, using an STRtree over individual lane segments.
+    """
+
+    projection = LocalMetricProjection.around_points(
+        [point for lane in bike_lanes for point in lane.line_points]
+    )
+
+    segments = split_bike_lanes_into_metric_segments(bike_lanes, projection)
+    segment_tree = STRtree(segments)
+
+    stop_east_metres, stop_north_metres = projection.project(
+        [stop.location.latitude for stop in bus_stops],
+        [stop.location.longitude for stop in bus_stops]
+    )
+    stop_points = shapely.points(stop_east_metres, stop_north_metres)
+
+
+    # Nearest segment of every stop, in a single batched query.
+    (nearest_stop_indices, _), nearest_distances = segment_tree.query_nearest(
+        stop_points,
+        return_distance=True,
+        all_matches=False
+    )
+
+    distances_to_nearest_lane = numpy.full(len(bus_stops), numpy.nan)
+    distances_to_nearest_lane[nearest_stop_indices] = nearest_distances
+
+
+    # Lane length inside the circle around every stop: segments are clipped
+    # to the circle and the clipped lengths are summed per stop.
+    stop_circles = shapely.buffer(stop_points, radius_in_metres, quad_segs=16)
+    circle_stop_indices, circle_segment_indices = segment_tree.query(
+        stop_circles,
+        predicate="intersects"
+    )
+
+    clipped_segment_lengths = shapely.length(shapely.intersection(
+        segments[circle_segment_indices],
+        stop_circles[circle_stop_indices]
+    ))
+
+    lane_lengths_within_radius = numpy.bincount(
+        circle_stop_indices,
+        weights=clipped_segment_lengths,
+        minlength=len(bus_stops)
+    )
+
+
+    connectivity_scores = compute_connectivity_scores(
+        distances_to_nearest_lane,
+        lane_lengths_within_radius,
+        radius_in_metres
+    )
+
+    return [
+        BusStopBikeConnectivity(
+            stop_id=stop.id,
+            distance_to_nearest_bike_lane_in_metres=None if math.isnan(distance) else distance,
+            bike_lane_length_within_radius_in_metres=lane_length,
+            connectivity_score=score
+        )
+        for stop, distance, lane_length, score in zip(
+            bus_stops,
+            distances_to_nearest_lane.tolist(),
+            lane_lengths_within_radius.tolist(),
+            connectivity_scores.tolist()
+        )
+    ]
@@ -0,0 +1,227 @@
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy
+
+from otmlj.avtobusi import TimeOfDay, MINUTES_PER_DAY, is_trip_active, minute_of_day
+
+
+# More chunks than workers, so that a slow chunk does not leave the other cores idle.
+CHUNKS_PER_WORKER: int = 4
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class StopTimesColumns:
+    number_of_columns: int
+    trip_id_column_index: int
+    arrival_time_column_index: int
+    stop_id_column_index: int
+
+
+@dataclass(init=True, repr=False, eq=False, frozen=True, slots=True)
+class StopTimesParsingContext:
+    """
+    Everything a worker needs besides its byte range; sent once per worker process.
+    """
+
+    stop_times_file_path: Path
+    columns: StopTimesColumns
+    stop_indices_by_id: dict[str, int]
+    active_trip_ids: Optional[set[str]]
+
+
+# Set in every worker process by `initialize_worker`.
+worker_parsing_context: Optional[StopTimesParsingContext] = None
+
+
+def initialize_worker(parsing_context: StopTimesParsingContext):
+    global worker_parsing_context
+    worker_parsing_context = parsing_context
+
+
+def parse_stop_times_header(header_line: str) -> StopTimesColumns:
+    column_names = header_line.strip().split(",")
+
+    # Only some of these are read, but all of them are required of a valid stop_times.txt.
+    if any(
+        column_name not in column_names
+        for column_name in ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"]
+    ):
+        raise RuntimeError(
+            "Invalid input data: expected trip_id, arrival_time, departure_time, stop_id and stop_sequence columns."
+        )
+
+    return StopTimesColumns(
+        number_of_columns=len(column_names),
+        trip_id_column_index=column_names.index("trip_id"),
+        arrival_time_column_index=column_names.index("arrival_time"),
+        stop_id_column_index=column_names.index("stop_id")
+    )
+
+
+def split_file_into_line_aligned_byte_ranges(
+    file_path: Path,
+    data_start_offset: int,
+    number_of_ranges: int
+) -> list[tuple[int, int]]:
+    """
+    :return: (start, end) byte offsets, each starting at the beginning of a line
+    """
+
+    file_size = file_path.stat().st_size
+    range_size = max((file_size - data_start_offset) // number_of_ranges, 1)
+
+    range_boundaries: list[int] = [data_start_offset]
+
+    with file_path.open("rb") as file:
+        for range_index in range(1, number_of_ranges):
+            tentative_boundary = data_start_offset + range_index * range_size
+            if tentative_boundary <= range_boundaries[-1]:
+                continue
+
+            # Move the boundary forward to the start of the next line.
+            file.seek(tentative_boundary - 1)
+            file.readline()
+            boundary = file.tell()
+
+            if boundary >= file_size:
+                break
+            if boundary > range_boundaries[-1]:
+                range_boundaries.append(boundary)
+
+    range_boundaries.append(file_size)
+
+    return list(zip(range_boundaries[:-1], range_boundaries[1:]))
+
+
+def count_arrivals_in_byte_range(
+    parsing_context: StopTimesParsingContext,
+    byte_range: tuple[int, int]
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    :return: non-empty cells (stop index * minutes per day + minute of day) and their arrival counts
+    """
+
+    range_start, range_end = byte_range
+    columns = parsing_context.columns
+
+    with parsing_context.stop_times_file_path.open("rb") as stop_times_file:
+        stop_times_file.seek(range_start)
+        raw_chunk = stop_times_file.read(range_end - range_start).decode("utf8")
+
+    arrival_cells: list[int] = []
+    for unparsed_data_line in raw_chunk.splitlines(keepends=False):
+        if unparsed_data_line == "":
+            continue
+
+        data_row = unparsed_data_line.split(",")
+
+        if len(data_row) != columns.number_of_columns:
+            raise RuntimeError(f"data does not have all the columns: {data_row}")
+
+        if not is_trip_active(data_row[columns.trip_id_column_index], parsing_context.active_trip_ids):
+            continue
+
+        stop_id = data_row[columns.stop_id_column_index]
+        stop_index = parsing_context.stop_indices_by_id.get(stop_id)
+        if stop_index is None:
+            raise RuntimeError(f"Unknown stop id in stop_times: {stop_id}")
+
+        arrival_time = TimeOfDay.from_colon_separated_hms(data_row[columns.arrival_time_column_index])
+        arrival_cells.append(stop_index * MINUTES_PER_DAY + minute_of_day(arrival_time))
+
+    cell_counts = numpy.bincount(numpy.array(arrival_cells, dtype=numpy.int64))
+    non_empty_cells = numpy.flatnonzero(cell_counts)
+
+    return non_empty_cells.astype(numpy.uint32), cell_counts[non_empty_cells].astype(numpy.uint32)
+
+
+def count_arrivals_in_byte_range_in_worker(byte_range: tuple[int, int]) -> tuple[numpy.ndarray, numpy.ndarray]:
+    return count_arrivals_in_byte_range(worker_parsing_context, byte_range)
+
+
+def count_arrivals_per_minute_in_stop_times_file(
+    stop_times_file_path: Path,
+    stop_ids: list[str],
+    active_trip_ids: Optional[set[str]] = None,
+    number_of_workers: Optional[int] = None
+) -> numpy.ndarray:
+    """
+    Parses stop_times.txt in line-aligned byte ranges spread over a process pool.
+    Each range is reduced to a sparse histogram of arrivals, which are then summed.
+
+    :param active_trip_ids: see `is_trip_active`
+    :param number_of_workers: defaults to the number of CPU cores; 1 parses in this process
+    :return: matrix of shape (number of stops, minutes per day), in the same stop order as `stop_ids`
+    """
+
+    if number_of_workers is None:
+        number_of_workers = os.cpu_count() or 1
+
+    with stop_times_file_path.open("rb") as stop_times_file:
+        columns = parse_stop_times_header(stop_times_file.readline().decode("utf-8-sig"))
+        data_start_offset = stop_times_file.tell()
+
+    parsing_context = StopTimesParsingContext(
+        stop_times_file_path=stop_times_file_path,
+        columns=columns,
+        stop_indices_by_id={
+            stop_id: stop_index
+            for stop_index, stop_id in enumerate(stop_ids)
+        },
+        active_trip_ids=active_trip_ids
+    )
+
+    byte_ranges = split_file_into_line_aligned_byte_ranges(
+        stop_times_file_path,
+        data_start_offset,
+        number_of_workers * CHUNKS_PER_WORKER if number_of_workers > 1 else 1
+    )
+
+    if number_of_workers == 1:
+        partial_histograms = [
+            count_arrivals_in_byte_range(parsing_context, byte_range)
+            for byte_range in byte_ranges
+        ]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=number_of_workers,
+            initializer=initialize_worker,
+            initargs=(parsing_context,)
+        ) as executor:
+            partial_histograms = list(executor.map(count_arrivals_in_byte_range_in_worker, byte_ranges))
+
+
+    arrivals_per_minute = numpy.zeros(len(stop_ids) * MINUTES_PER_DAY, dtype=numpy.int64)
+    for non_empty_cells, cell_counts in partial_histograms:
+        # Cells are unique within a partial histogram, so plain fancy-index addition is safe.
+        arrivals_per_minute[non_empty_cells] += cell_counts
+
+    return arrivals_per_minute.reshape(len(stop_ids), MINUTES_PER_DAY)
+
+
+def count_arrivals_per_minute_in_feed(
+    feed_zip: zipfile.ZipFile,
+    stop_ids: list[str],
+    active_trip_ids: Optional[set[str]] = None,
+    number_of_workers: Optional[int] = None
+) -> numpy.ndarray:
+    """
+    Same as `count_arrivals_per_minute_in_stop_times_file`, for stop_times.txt inside a GTFS zip.
+    """
+
+    # Compressed data cannot be read from arbitrary offsets, so the file is extracted first.
+    with tempfile.TemporaryDirectory() as temporary_directory_path:
+        stop_times_file_path = Path(feed_zip.extract("stop_times.txt", path=temporary_directory_path))
+
+        return count_arrivals_per_minute_in_stop_times_file(
+            stop_times_file_path,
+            stop_ids,
+            active_trip_ids=active_trip_ids,
+            number_of_workers=number_of_workers
+        )
@@ -0,0 +1,544 @@
+import asyncio
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy
+import shapely
+from area import area as geo_json_area
+from shapely import Polygon
+
+from otmlj.avtobusi import BusStopWithStatistics
+from otmlj.common import LatitudeLongitude
+from otmlj.green_zone import GreenZone
+from otmlj.kolesa import BikeLaneMultiLine
+from otmlj.p_plus_r import PPlusR
+
+
+DEFAULT_QUERY_SERVER_HOST: str = "127.0.0.1"
+DEFAULT_QUERY_SERVER_PORT: int = 8765
+DEFAULT_RESPONSE_CACHE_SIZE: int = 256
+
+MAXIMUM_REQUEST_BODY_SIZE_IN_BYTES: int = 4 * 1024 * 1024
+
+
+class QueryError(RuntimeError):
+    """
+    Raised when a query is malformed; reported to the client as HTTP 400.
+    """
+    pass
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class BoundingBox:
+    south: float
+    west: float
+    north: float
+    east: float
+
+    @classmethod
+    def from_comma_separated_string(cls, raw_bounding_box: str):
+        """
+        Parses the latitude-first "south,west,north,east" format.
+        """
+        try:
+            south, west, north, east = [float(value) for value in raw_bounding_box.split(",")]
+        except ValueError:
+            raise QueryError("Invalid bbox: expected south,west,north,east.")
+
+        if south > north or west > east:
+            raise QueryError("Invalid bbox: south/west must not exceed north/east.")
+
+        return BoundingBox(south=south, west=west, north=north, east=east)
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class HourWindow:
+    # Inclusive start and exclusive end, both in range 0 to 24.
+    from_hour: int
+    to_hour: int
+
+    @classmethod
+    def from_query_parameters(cls, parameters: dict[str, str]):
+        try:
+            from_hour = int(parameters.get("from_hour", 0))
+            to_hour = int(parameters.get("to_hour", 24))
+        except ValueError:
+            raise QueryError("Invalid hour window: from_hour and to_hour must be integers.")
+
+        if not (0 <= from_hour < to_hour <= 24):
+            raise QueryError("Invalid hour window: expected 0 <= from_hour < to_hour <= 24.")
+
+        return HourWindow(from_hour=from_hour, to_hour=to_hour)
+
+
+class QueryDataset:
+    """
+    Parsed visualization data, kept in memory together with
+    column arrays that make viewport and polygon queries cheap.
+    """
+
+    bus_stops: list[BusStopWithStatistics]
+    bike_lanes: list[BikeLaneMultiLine]
+    green_zone: GreenZone
+    existing_p_plus_r: list[PPlusR]
+    proposed_p_plus_r: list[PPlusR]
+
+    # Shape (number of stops,).
+    stop_latitudes: numpy.ndarray
+    stop_longitudes: numpy.ndarray
+    # Shape (number of stops, 24), column `i` holding arrivals from `i`:00 to `i`:59 clock time,
+    # so that hour windows can be sliced directly.
+    stop_arrivals_per_hour: numpy.ndarray
+    # Shape (number of lanes, 4): south, west, north, east.
+    lane_bounding_boxes: numpy.ndarray
+
+    def __init__(
+        self,
+        bus_stops: list[BusStopWithStatistics],
+        bike_lanes: list[BikeLaneMultiLine],
+        green_zone: GreenZone,
+        existing_p_plus_r: list[PPlusR],
+        proposed_p_plus_r: list[PPlusR]
+    ):
+        self.bus_stops = bus_stops
+        self.bike_lanes = bike_lanes
+        self.green_zone = green_zone
+        self.existing_p_plus_r = existing_p_plus_r
+        self.proposed_p_plus_r = proposed_p_plus_r
+
+        self.stop_latitudes = numpy.array(
+            [stop.location.latitude for stop in bus_stops],
+            dtype=numpy.float64
+        )
+        self.stop_longitudes = numpy.array(
+            [stop.location.longitude for stop in bus_stops],
+            dtype=numpy.float64
+        )
+        self.stop_arrivals_per_hour = numpy.array(
+            [stop.arrivals_per_hour.arrivals for stop in bus_stops],
+            dtype=numpy.int64
+        ).reshape(len(bus_stops), 24)
+
+        lane_bounding_boxes = numpy.empty((len(bike_lanes), 4), dtype=numpy.float64)
+        for lane_index, lane in enumerate(bike_lanes):
+            latitudes = [point.latitude for point in lane.line_points]
+            longitudes = [point.longitude for point in lane.line_points]
+            lane_bounding_boxes[lane_index] = (
+                min(latitudes), min(longitudes), max(latitudes), max(longitudes)
+            )
+
+        self.lane_bounding_boxes = lane_bounding_boxes
+
+    def stop_indices_inside_bounding_box(self, bounding_box: BoundingBox) -> numpy.ndarray:
+        is_inside = (
+            (self.stop_latitudes >= bounding_box.south)
+            & (self.stop_latitudes <= bounding_box.north)
+            & (self.stop_longitudes >= bounding_box.west)
+            & (self.stop_longitudes <= bounding_box.east)
+        )
+
+        return numpy.flatnonzero(is_inside)
+
+    def stop_indices_inside_polygon(self, polygon: Polygon) -> numpy.ndarray:
+        # Same coordinate order as in `parse_green_zone_GeoJSON_polygon`: x is latitude.
+        is_inside = shapely.contains_xy(polygon, self.stop_latitudes, self.stop_longitudes)
+
+        return numpy.flatnonzero(is_inside)
+
+    def lane_indices_intersecting_bounding_box(self, bounding_box: BoundingBox) -> numpy.ndarray:
+        intersects = (
+            (self.lane_bounding_boxes[:, 0] <= bounding_box.north)
+            & (self.lane_bounding_boxes[:, 2] >= bounding_box.south)
+            & (self.lane_bounding_boxes[:, 1] <= bounding_box.east)
+            & (self.lane_bounding_boxes[:, 3] >= bounding_box.west)
+        )
+
+        return numpy.flatnonzero(intersects)
+
+
+class ResponseCache:
+    """
+    Least-recently-used cache of fully encoded response bodies.
+    """
+
+    maximum_size: int
+    entries: OrderedDict[tuple, bytes]
+    hits: int
+    misses: int
+
+    def __init__(self, maximum_size: int = DEFAULT_RESPONSE_CACHE_SIZE):
+        self.maximum_size = maximum_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        cached_body = self.entries.get(key)
+
+        if cached_body is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return cached_body
+
+    def put(self, key: tuple, body: bytes):
+        self.entries[key] = body
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maximum_size:
+            self.entries.popitem(last=False)
+
+    def serialize_statistics(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "maximum_size": self.maximum_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def parse_polygon_from_query(
+    parameters: dict[str, str],
+    body: bytes
+) -> list[LatitudeLongitude]:
+    """
+    Accepts either a `polygon=lat,lng;lat,lng;...` query parameter or a GeoJSON
+    Polygon geometry (or a Feature containing one) as the request body.
+    """
+
+    if "polygon" in parameters:
+        polygon_points: list[LatitudeLongitude] = []
+
+        for raw_point in parameters["polygon"].split(";"):
+            try:
+                latitude, longitude = [float(value) for value in raw_point.split(",")]
+            except ValueError:
+                raise QueryError("Invalid polygon: expected lat,lng;lat,lng;... pairs.")
+
+            polygon_points.append(LatitudeLongitude(latitude=latitude, longitude=longitude))
+    elif len(body) > 0:
+        try:
+            geometry = json.loads(body)
+        except json.JSONDecodeError:
+            raise QueryError("Invalid polygon: request body is not valid JSON.")
+
+        if not isinstance(geometry, dict):
+            raise QueryError("Invalid polygon: expected a GeoJSON object.")
+
+        if geometry.get("type") == "Feature":
+            geometry = geometry.get("geometry")
+
+        if not isinstance(geometry, dict) or geometry.get("type") != "Polygon":
+            raise QueryError("Invalid polygon: expected a GeoJSON Polygon geometry.")
+
+        try:
+            polygon_points = [
+                LatitudeLongitude(latitude=float(latitude), longitude=float(longitude))
+                for longitude, latitude in geometry["coordinates"][0]
+            ]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise QueryError("Invalid polygon: expected coordinates as a list of [lng, lat] rings.")
+    else:
+        raise QueryError("Missing polygon: pass a polygon parameter or a GeoJSON body.")
+
+    if len(polygon_points) < 3:
+        raise QueryError("Invalid polygon: at least three points are required.")
+
+    return polygon_points
+
+
+def query_stops(dataset: QueryDataset, parameters: dict[str, str]) -> dict:
+    hour_window = HourWindow.from_query_parameters(parameters)
+
+    if "bbox" in parameters:
+        stop_indices = dataset.stop_indices_inside_bounding_box(
+            BoundingBox.from_comma_separated_string(parameters["bbox"])
+        )
+    else:
+        stop_indices = numpy.arange(len(dataset.bus_stops))
+
+    arrivals_in_window = dataset.stop_arrivals_per_hour[
+        stop_indices, hour_window.from_hour:hour_window.to_hour
+    ].sum(axis=1)
+
+    return {
+        "from_hour": hour_window.from_hour,
+        "to_hour": hour_window.to_hour,
+        "stops": [
+            {
+                **dataset.bus_stops[stop_index].serialize_as_dict(),
+                "arrivals_in_window": int(arrivals)
+            }
+            for stop_index, arrivals in zip(stop_indices.tolist(), arrivals_in_window.tolist())
+        ]
+    }
+
+
+def query_arrivals_per_hour_in_bounding_box(dataset: QueryDataset, parameters: dict[str, str]) -> dict:
+    if "bbox" not in parameters:
+        raise QueryError("Missing bbox parameter.")
+
+    stop_indices = dataset.stop_indices_inside_bounding_box(
+        BoundingBox.from_comma_separated_string(parameters["bbox"])
+    )
+    arrivals_per_hour = dataset.stop_arrivals_per_hour[stop_indices].sum(axis=0)
+
+    return {
+        "number_of_stops": int(stop_indices.size),
+        "arrivals_per_hour": arrivals_per_hour.tolist(),
+        "total_arrivals": int(arrivals_per_hour.sum())
+    }
+
+
+def query_bike_lanes(dataset: QueryDataset, parameters: dict[str, str]) -> dict:
+    if "bbox" in parameters:
+        lane_indices = dataset.lane_indices_intersecting_bounding_box(
+            BoundingBox.from_comma_separated_string(parameters["bbox"])
+        )
+    else:
+        lane_indices = numpy.arange(len(dataset.bike_lanes))
+
+    return {
+        "bike_lanes": [
+            dataset.bike_lanes[lane_index].serialize_as_dict()
+            for lane_index in lane_indices.tolist()
+        ]
+    }
+
+
+def query_zones(dataset: QueryDataset, _parameters: dict[str, str]) -> dict:
+    return {
+        "green_zone": dataset.green_zone.serialize(),
+        "p_plus_r": {
+            "existing": [station.serialize() for station in dataset.existing_p_plus_r],
+            "proposed": [station.serialize() for station in dataset.proposed_p_plus_r]
+        }
+    }
+
+
+def query_polygon_scenario(
+    dataset: QueryDataset,
+    parameters: dict[str, str],
+    body: bytes
+) -> dict:
+    """
+    What-if analysis for a user-drawn zone: how many arrivals per hour would happen inside it.
+    """
+
+    hour_window = HourWindow.from_query_parameters(parameters)
+    polygon_points = parse_polygon_from_query(parameters, body)
+
+    zone_polygon = Polygon([
+        (point.latitude, point.longitude)
+        for point in polygon_points
+    ])
+
+    if not zone_polygon.is_valid:
+        raise QueryError("Invalid polygon: the polygon must not self-intersect.")
+
+    stop_indices = dataset.stop_indices_inside_polygon(zone_polygon)
+    arrivals_per_hour = dataset.stop_arrivals_per_hour[stop_indices].sum(axis=0)
+
+    zone_area = geo_json_area({
+        "type": "Polygon",
+        "coordinates": [[
+            [point.longitude, point.latitude]
+            for point in polygon_points
+        ]]
+    })
+
+    return {
+        "area_in_square_metres": zone_area,
+        "number_of_stops_inside_zone": int(stop_indices.size),
+        "stop_ids_inside_zone": [
+            dataset.bus_stops[stop_index].id
+            for stop_index in stop_indices.tolist()
+        ],
+        "arrivals_per_hour": arrivals_per_hour.tolist(),
+        "arrivals_in_window": int(arrivals_per_hour[hour_window.from_hour:hour_window.to_hour].sum()),
+        "total_arrivals_per_day_inside_zone": int(arrivals_per_hour.sum())
+    }
+
+
+HTTP_STATUS_REASONS: dict[int, str] = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class QueryServer:
+    """
+    Minimal asyncio HTTP/1.1 server answering JSON queries over a `QueryDataset`.
+
+    Endpoints (all respond with JSON):
+      GET       /stops?bbox=&from_hour=&to_hour=
+      GET       /arrivals-per-hour?bbox=
+      GET       /bike-lanes?bbox=
+      GET       /zones
+      GET/POST  /scenario/polygon?polygon=&from_hour=&to_hour=   (or a GeoJSON Polygon body)
+      GET       /cache
+    """
+
+    dataset: QueryDataset
+    response_cache: ResponseCache
+
+    def __init__(self, dataset: QueryDataset, response_cache_size: int = DEFAULT_RESPONSE_CACHE_SIZE):
+        self.dataset = dataset
+        self.response_cache = ResponseCache(maximum_size=response_cache_size)
+
+    def answer_query(self, path: str, parameters: dict[str, str], body: bytes) -> Optional[bytes]:
+        """
+        :return: encoded JSON response body, or None if the path is unknown
+        """
+
+        if path == "/cache":
+            return json.dumps(self.response_cache.serialize_statistics()).encode("utf8")
+
+        # Parameters are sorted so that equivalent queries share a cache entry.
+        cache_key = (path, tuple(sorted(parameters.items())), body)
+
+        cached_body = self.response_cache.get(cache_key)
+        if cached_body is not None:
+            return cached_body
+
+        if path == "/stops":
+            result = query_stops(self.dataset, parameters)
+        elif path == "/arrivals-per-hour":
+            result = query_arrivals_per_hour_in_bounding_box(self.dataset, parameters)
+        elif path == "/bike-lanes":
+            result = query_bike_lanes(self.dataset, parameters)
+        elif path == "/zones":
+            result = query_zones(self.dataset, parameters)
+        elif path == "/scenario/polygon":
+            result = query_polygon_scenario(self.dataset, parameters, body)
+        else:
+            return None
+
+        encoded_body = json.dumps(result, ensure_ascii=False).encode("utf8")
+        self.response_cache.put(cache_key, encoded_body)
+
+        return encoded_body
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, body = await self._read_and_answer_request(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        header_lines = [
+            f"HTTP/1.1 {status} {HTTP_STATUS_REASONS[status]}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            # The Vite dev server runs on a different port.
+            "Access-Control-Allow-Origin: *",
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers: Content-Type",
+            "Connection: close",
+        ]
+
+        writer.write(("\r\n".join(header_lines) + "\r\n\r\n").encode("latin-1") + body)
+
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_stripped_line(reader: asyncio.StreamReader) -> Optional[str]:
+        """
+        :return: None if the line is longer than the reader's limit (64 KiB by default)
+        """
+
+        try:
+            return (await reader.readline()).decode("latin-1").strip()
+        except ValueError:
+            # `StreamReader.readline` turns `asyncio.LimitOverrunError` into a ValueError.
+            return None
+
+    async def _read_and_answer_request(self, reader: asyncio.StreamReader) -> tuple[int, bytes]:
+        request_line = await self._read_stripped_line(reader)
+        if request_line is None:
+            return 400, json.dumps({"error": "Request line too long."}).encode("utf8")
+
+        request_line_parts = request_line.split(" ")
+        if len(request_line_parts) != 3:
+            return 400, json.dumps({"error": "Malformed request line."}).encode("utf8")
+
+        method, target, _ = request_line_parts
+
+        headers: dict[str, str] = {}
+        while True:
+            header_line = await self._read_stripped_line(reader)
+            if header_line is None:
+                return 400, json.dumps({"error": "Header line too long."}).encode("utf8")
+            if header_line == "":
+                break
+
+            name, _, value = header_line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            content_length = int(headers.get("content-length", 0))
+        except ValueError:
+            return 400, json.dumps({"error": "Invalid Content-Length header."}).encode("utf8")
+
+        if content_length < 0:
+            return 400, json.dumps({"error": "Invalid Content-Length header."}).encode("utf8")
+        if content_length > MAXIMUM_REQUEST_BODY_SIZE_IN_BYTES:
+            return 413, json.dumps({"error": "Request body too large."}).encode("utf8")
+
+        body = await reader.readexactly(content_length) if content_length > 0 else b""
+
+        if method == "OPTIONS":
+            return 204, b""
+        if method not in ("GET", "POST"):
+            return 405, json.dumps({"error": f"Unsupported method {method}."}).encode("utf8")
+
+        split_target = urlsplit(target)
+        parameters = dict(parse_qsl(split_target.query))
+
+        try:
+            response_body = self.answer_query(split_target.path, parameters, body)
+        except QueryError as error:
+            return 400, json.dumps({"error": str(error)}).encode("utf8")
+        except Exception as error:
+            return 500, json.dumps({"error": repr(error)}).encode("utf8")
+
+        if response_body is None:
+            return 404, json.dumps({"error": f"Unknown path {split_target.path}."}).encode("utf8")
+
+        return 200, response_body
+
+    async def serve_forever(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+
+        print(f"Query server listening on http://{host}:{port}")
+
+        async with server:
+            await server.serve_forever()
+
+
+def run_query_server(
+    dataset: QueryDataset,
+    host: str = DEFAULT_QUERY_SERVER_HOST,
+    port: int = DEFAULT_QUERY_SERVER_PORT
+):
+    query_server = QueryServer(dataset)
+
+    try:
+        asyncio.run(query_server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        print("Query server stopped.")
@@ -1,15 +1,26 @@
+import argparse
 import json
 import time
 import zipfile
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
-from otmlj.avtobusi import parse_daily_bus_stop_entries_from_raw_csv_data, parse_bus_stops_from_raw_csv_data, BusStop, \
-    BusArrival, BusStopWithStatistics, merge_arrivals_into_corresponding_bus_stops
+import numpy
+
+from otmlj.avtobusi import parse_bus_stops_from_raw_csv_data, BusStop, BusStopWithStatistics, \
+    merge_arrivals_per_minute_into_corresponding_bus_stops, ArrivalFrames, build_arrival_frames_from_arrivals_per_minute, \
+    WEEKDAY_COLUMN_NAMES
+from otmlj.feed_comparison import load_feed_for_weekday, compare_feeds
 from otmlj.green_zone import GreenZone, parse_green_zone_GeoJSON_polygon
-from otmlj.kolesa import parse_bike_lanes_from_WGS84_GeoJSON, BikeLaneMultiLine
+from otmlj.kolesa import parse_bike_lanes_from_WGS84_GeoJSON, BikeLaneMultiLine, simplify_bike_lanes, \
+    build_bike_network_graph, find_connected_components, find_gaps_between_components, \
+    compute_reachable_network_lengths, BikeNetworkComponent, BikeNetworkGap, BikeNetworkReachability
+from otmlj.multimodal import BusStopBikeConnectivity, join_bus_stops_with_bike_lanes
+from otmlj.parallel_parsing import count_arrivals_per_minute_in_feed
 from otmlj.p_plus_r import PPlusR, EXISTING_P_PLUS_R_STATIONS, PROPOSED_NEW_P_PLUS_R_STATIONS
+from otmlj.server import QueryDataset, run_query_server, DEFAULT_QUERY_SERVER_HOST, DEFAULT_QUERY_SERVER_PORT
 
 SCRIPT_DIRECTORY_PATH: Path = Path(__file__).parent
 RAW_DATA_DIRECTORY_PATH: Path = SCRIPT_DIRECTORY_PATH / "raw-data"
@@ -18,6 +29,25 @@ OUTPUT_DATA_DIRECTORY_PATH: Path = SCRIPT_DIRECTORY_PATH / "output-data"
 LPP_BUS_FEED_DATA_ZIP_PATH: Path = RAW_DATA_DIRECTORY_PATH / "lpp-avtobus" / "LPP_2024-05-09_feed.zip"
 BIKE_LANES_DATA_ZIP_PATH: Path = RAW_DATA_DIRECTORY_PATH / "lj-kolesarji" / "MOL_KolesarskePoti_wgs84.json"
 GREEN_ZONE_GEOJSON_POLYGON_PATH: Path = RAW_DATA_DIRECTORY_PATH / "green-zone" / "green-zone-polygon.json"
+PARSED_FEED_CACHE_DIRECTORY_PATH: Path = OUTPUT_DATA_DIRECTORY_PATH / "parsed-feed-cache"
+
+# Bike lanes are drawn as map polylines, so sub-metre detail is not visible.
+DEFAULT_BIKE_LANE_SIMPLIFICATION_TOLERANCE_IN_METRES: float = 1.0
+# Six decimal places correspond to roughly 0.1 metres.
+DEFAULT_BIKE_LANE_COORDINATE_DECIMAL_PLACES: int = 6
+
+# Lane endpoints closer than this are treated as the same network node.
+BIKE_NETWORK_SNAPPING_TOLERANCE_IN_METRES: float = 2.0
+BIKE_NETWORK_MAXIMUM_GAP_IN_METRES: float = 50.0
+# How far one is willing to walk from a P+R or bus stop to the nearest bike lane.
+BIKE_NETWORK_ACCESS_DISTANCE_IN_METRES: float = 300.0
+BIKE_NETWORK_MAXIMUM_CYCLING_DISTANCE_IN_METRES: float = 5000.0
+
+# Radius around each bus stop in which bike lanes count towards its multimodal connectivity.
+MULTIMODAL_STOP_RADIUS_IN_METRES: float = 300.0
+
+# Stops whose id and code both changed between feeds are still matched if they moved less than this.
+FEED_COMPARISON_STOP_ALIGNMENT_DISTANCE_IN_METRES: float = 30.0
 
 
 if not OUTPUT_DATA_DIRECTORY_PATH.is_dir():
@@ -42,10 +72,48 @@ class BusVisualizationData:
         }
 
 
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class BikeNetworkVisualizationData:
+    number_of_nodes: int
+    number_of_edges: int
+    components: list[BikeNetworkComponent]
+    gaps: list[BikeNetworkGap]
+    p_plus_r_reachability: list[BikeNetworkReachability]
+    bus_stop_reachability: list[BikeNetworkReachability]
+
+    def serialize(self) -> dict:
+        return {
+            "number_of_nodes": self.number_of_nodes,
+            "number_of_edges": self.number_of_edges,
+            "components": [
+                component.serialize()
+                for component in self.components
+            ],
+            "gaps": [
+                gap.serialize()
+                for gap in self.gaps
+            ],
+            "p_plus_r_reachability": [
+                reachability.serialize()
+                for reachability in self.p_plus_r_reachability
+            ],
+            # Keyed by stop id (the reachability name) as [distance to network, reachable length],
+            # since the stops themselves are already part of the bus data.
+            "bus_stop_reachability": {
+                reachability.name: [
+                    reachability.distance_to_network_in_metres,
+                    reachability.reachable_length_in_metres
+                ]
+                for reachability in self.bus_stop_reachability
+            }
+        }
+
+
 @dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
 class BikeVisualizationData:
     bike_lanes: list[BikeLaneMultiLine]
     total_length_in_metres: float
+    network: BikeNetworkVisualizationData
 
     def serialize(self) -> dict:
         return {
@@ -53,7 +121,8 @@ class BikeVisualizationData:
                 lane.serialize_as_dict()
                 for lane in self.bike_lanes
             ],
-            "total_length_in_metres": self.total_length_in_metres
+            "total_length_in_metres": self.total_length_in_metres,
+            "network": self.network.serialize()
         }
 
 
@@ -86,42 +155,65 @@ class GreenZoneVisualizationData:
 
 
 
+@dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
+class MultimodalVisualizationData:
+    radius_in_metres: float
+    stop_connectivity: list[BusStopBikeConnectivity]
+
+    def serialize(self) -> dict:
+        return {
+            "radius_in_metres": self.radius_in_metres,
+            "stop_connectivity": [
+                connectivity.serialize()
+                for connectivity in self.stop_connectivity
+            ]
+        }
+
+
 @dataclass(init=True, repr=True, eq=True, frozen=True, slots=True)
 class VisualizationData:
     bus: BusVisualizationData
     bike: BikeVisualizationData
     p_plus_r: PPlusRVisualizationData
     green_zone: GreenZoneVisualizationData
+    multimodal: MultimodalVisualizationData
 
     def serialize_as_dict(self) -> dict:
         return {
             "bus": self.bus.serialize(),
             "bike": self.bike.serialize(),
             "p_plus_r": self.p_plus_r.serialize(),
-            "green_zone": self.green_zone.serialize()
+            "green_zone": self.green_zone.serialize(),
+            "multimodal": self.multimodal.serialize()
         }
 
 
 
 
-def process_bus_data() -> tuple[list[BusStop], list[BusArrival]]:
+def process_bus_data(number_of_workers: Optional[int]) -> tuple[list[BusStop], numpy.ndarray]:
+    """
+    :return: bus stops, and a matrix of their arrivals per minute of the day
+    """
+
     zip_data = zipfile.ZipFile(LPP_BUS_FEED_DATA_ZIP_PATH, mode="r")
 
 
     raw_stops_csv_data = zip_data.open("stops.txt", mode="r").read().decode("utf8")
     stops = parse_bus_stops_from_raw_csv_data(raw_stops_csv_data)
 
-    raw_stop_times_data = zip_data.open("stop_times.txt").read().decode("utf8")
-    daily_stop_entries = parse_daily_bus_stop_entries_from_raw_csv_data(raw_stop_times_data)
+    arrivals_per_minute = count_arrivals_per_minute_in_feed(
+        zip_data,
+        [stop.id for stop in stops],
+        number_of_workers=number_of_workers
+    )
 
 
     # print("\n".join([str(s) for s in stops[:50]]))
     # print(len(stops))
     #
-    # print("\n".join([str(s) for s in daily_stop_entries[:50]]))
-    # print(len(daily_stop_entries))
+    # print(f"Total daily arrivals: {arrivals_per_minute.sum()}")
 
-    return stops, daily_stop_entries
+    return stops, arrivals_per_minute
 
 
 def process_bike_data() -> tuple[list[BikeLaneMultiLine], float]:
@@ -138,6 +230,60 @@ def process_bike_data() -> tuple[list[BikeLaneMultiLine], float]:
     return bike_lanes, total_lane_length_metres
 
 
+def simplify_bike_data(
+    bike_lanes: list[BikeLaneMultiLine],
+    simplification_tolerance_in_metres: float,
+    coordinate_decimal_places: int
+) -> list[BikeLaneMultiLine]:
+    simplified_bike_lanes, simplification_report = simplify_bike_lanes(
+        bike_lanes,
+        tolerance_in_metres=simplification_tolerance_in_metres,
+        coordinate_decimal_places=coordinate_decimal_places
+    )
+
+    print(f"Bike lane simplification: {simplification_report.describe()}")
+
+    return simplified_bike_lanes
+
+
+def process_bike_network(
+    bike_lanes: list[BikeLaneMultiLine],
+    bus_stops: list[BusStopWithStatistics]
+) -> BikeNetworkVisualizationData:
+    graph = build_bike_network_graph(bike_lanes, BIKE_NETWORK_SNAPPING_TOLERANCE_IN_METRES)
+
+    node_components, components = find_connected_components(graph)
+    gaps = find_gaps_between_components(graph, node_components, BIKE_NETWORK_MAXIMUM_GAP_IN_METRES)
+
+    p_plus_r_reachability = compute_reachable_network_lengths(
+        graph,
+        [
+            (station.name, station.location)
+            for station in EXISTING_P_PLUS_R_STATIONS + PROPOSED_NEW_P_PLUS_R_STATIONS
+        ],
+        access_distance_in_metres=BIKE_NETWORK_ACCESS_DISTANCE_IN_METRES,
+        maximum_cycling_distance_in_metres=BIKE_NETWORK_MAXIMUM_CYCLING_DISTANCE_IN_METRES
+    )
+    bus_stop_reachability = compute_reachable_network_lengths(
+        graph,
+        [
+            (stop.id, stop.location)
+            for stop in bus_stops
+        ],
+        access_distance_in_metres=BIKE_NETWORK_ACCESS_DISTANCE_IN_METRES,
+        maximum_cycling_distance_in_metres=BIKE_NETWORK_MAXIMUM_CYCLING_DISTANCE_IN_METRES
+    )
+
+    return BikeNetworkVisualizationData(
+        number_of_nodes=graph.number_of_nodes,
+        number_of_edges=graph.number_of_edges,
+        components=components,
+        gaps=gaps,
+        p_plus_r_reachability=p_plus_r_reachability,
+        bus_stop_reachability=bus_stop_reachability
+    )
+
+
 def process_green_zone(bus_stops: list[BusStopWithStatistics]) -> GreenZone:
     with GREEN_ZONE_GEOJSON_POLYGON_PATH.open("r", encoding="utf8") as green_zone_file:
         geojson_string = green_zone_file.read()
@@ -152,7 +298,9 @@ def export_processed_data_to_file_for_visualization(
     bus_stops_with_arrivals: list[BusStopWithStatistics],
     bike_lanes: list[BikeLaneMultiLine],
     total_bike_lane_length_metres: float,
-    green_zone: GreenZone
+    bike_network: BikeNetworkVisualizationData,
+    green_zone: GreenZone,
+    bus_stop_bike_connectivity: list[BusStopBikeConnectivity]
 ):
     full_data_structure = VisualizationData(
         bus=BusVisualizationData(
@@ -161,6 +309,7 @@ def export_processed_data_to_file_for_visualization(
         bike=BikeVisualizationData(
             bike_lanes=bike_lanes,
             total_length_in_metres=total_bike_lane_length_metres,
+            network=bike_network,
         ),
         p_plus_r=PPlusRVisualizationData(
             existing=EXISTING_P_PLUS_R_STATIONS,
@@ -168,6 +317,10 @@ def export_processed_data_to_file_for_visualization(
         ),
         green_zone=GreenZoneVisualizationData(
             green_zone=green_zone
+        ),
+        multimodal=MultimodalVisualizationData(
+            radius_in_metres=MULTIMODAL_STOP_RADIUS_IN_METRES,
+            stop_connectivity=bus_stop_bike_connectivity
         )
     )
 
@@ -183,16 +336,204 @@ def export_processed_data_to_file_for_visualization(
         )
 
 
+def serve_processed_data(arguments: argparse.Namespace):
+    bus_stops, bus_arrivals_per_minute = process_bus_data(arguments.parse_workers)
+    bus_stops_with_arrivals = merge_arrivals_per_minute_into_corresponding_bus_stops(bus_stops, bus_arrivals_per_minute)
+    bike_lanes, _ = process_bike_data()
+    bike_lanes = simplify_bike_data(
+        bike_lanes,
+        arguments.bike_lane_tolerance,
+        arguments.bike_lane_decimal_places
+    )
+    green_zone = process_green_zone(bus_stops_with_arrivals)
+
+    dataset = QueryDataset(
+        bus_stops=bus_stops_with_arrivals,
+        bike_lanes=bike_lanes,
+        green_zone=green_zone,
+        existing_p_plus_r=EXISTING_P_PLUS_R_STATIONS,
+        proposed_p_plus_r=PROPOSED_NEW_P_PLUS_R_STATIONS
+    )
+
+    run_query_server(dataset, host=arguments.host, port=arguments.port)
+
+
+def parse_command_line_arguments() -> argparse.Namespace:
+    argument_parser = argparse.ArgumentParser(
+        description="Processes raw data into the JSON file used by the visualization."
+    )
+    argument_parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="instead of exporting a file, keep the processed data in memory and answer queries over HTTP"
+    )
+    argument_parser.add_argument("--host", default=DEFAULT_QUERY_SERVER_HOST)
+    argument_parser.add_argument("--port", type=int, default=DEFAULT_QUERY_SERVER_PORT)
+    argument_parser.add_argument(
+        "--bike-lane-tolerance",
+        type=float,
+        default=DEFAULT_BIKE_LANE_SIMPLIFICATION_TOLERANCE_IN_METRES,
+        help="maximum distance in metres a simplified bike lane may deviate from the original"
+    )
+    argument_parser.add_argument(
+        "--bike-lane-decimal-places",
+        type=int,
+        default=DEFAULT_BIKE_LANE_COORDINATE_DECIMAL_PLACES,
+        help="number of decimal places bike lane coordinates are rounded to"
+    )
+
+    argument_parser.add_argument(
+        "--arrival-frames-slot-minutes",
+        type=int,
+        choices=[1, 5, 15, 30, 60],
+        default=None,
+        help="additionally export per-stop arrivals in time slots of this many minutes, for animated playback"
+    )
+    argument_parser.add_argument(
+        "--arrival-frames-encoding",
+        choices=["sparse", "dense"],
+        default="sparse",
+        help="sparse: run-length encoded rows; dense: base64 of the uint16 stop x slot matrix"
+    )
+
+    argument_parser.add_argument(
+        "--compare-feeds",
+        nargs="+",
+        type=Path,
+        metavar="FEED_ZIP",
+        default=None,
+        help="instead of exporting the visualization data, compare arrivals between two or more GTFS feeds (oldest first)"
+    )
+    argument_parser.add_argument(
+        "--service-weekday",
+        choices=WEEKDAY_COLUMN_NAMES,
+        default="wednesday",
+        help="compare feeds on the first date with service on this weekday"
+    )
+
+    argument_parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=None,
+        help="number of processes parsing stop_times.txt (defaults to the number of CPU cores)"
+    )
+
+    arguments = argument_parser.parse_args()
+
+    if arguments.compare_feeds is not None and len(arguments.compare_feeds) < 2:
+        argument_parser.error("--compare-feeds needs at least two feeds")
+    if arguments.parse_workers is not None and arguments.parse_workers < 1:
+        argument_parser.error("--parse-workers must be at least 1")
+
+    return arguments
+
+
+def export_arrival_frames_to_file_for_visualization(
+    arrival_frames: ArrivalFrames,
+    encoding: str
+):
+    formatted_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output_file_path = OUTPUT_DATA_DIRECTORY_PATH / f"otmlj-arrival-frames_{formatted_datetime}.json"
+
+    # Written without indentation, the frames are meant to be as small as possible.
+    with output_file_path.open("w", encoding="utf8") as output_file:
+        json.dump(
+            arrival_frames.serialize(encoding),
+            output_file,
+            separators=(",", ":"),
+            ensure_ascii=False
+        )
+
+
+def compare_bus_feeds(feed_zip_paths: list[Path], weekday: int, number_of_workers: Optional[int]):
+    """
+    Compares arrivals on the given weekday between each pair of consecutive feeds.
+    """
+
+    parsed_feeds = [
+        load_feed_for_weekday(feed_zip_path, weekday, PARSED_FEED_CACHE_DIRECTORY_PATH, number_of_workers)
+        for feed_zip_path in feed_zip_paths
+    ]
+
+    with GREEN_ZONE_GEOJSON_POLYGON_PATH.open("r", encoding="utf8") as green_zone_file:
+        green_zone = parse_green_zone_GeoJSON_polygon(json.load(green_zone_file), [])
+
+    comparisons = [
+        compare_feeds(
+            previous_feed,
+            next_feed,
+            [("green_zone", green_zone.polygon_bounds)],
+            FEED_COMPARISON_STOP_ALIGNMENT_DISTANCE_IN_METRES
+        )
+        for previous_feed, next_feed in zip(parsed_feeds[:-1], parsed_feeds[1:])
+    ]
+
+    formatted_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output_file_path = OUTPUT_DATA_DIRECTORY_PATH / f"otmlj-feed-comparison_{formatted_datetime}.json"
+
+    with output_file_path.open("w", encoding="utf8") as output_file:
+        json.dump(
+            {
+                "comparisons": [
+                    comparison.serialize()
+                    for comparison in comparisons
+                ]
+            },
+            output_file,
+            indent=2,
+            ensure_ascii=False
+        )
+
+    for comparison in comparisons:
+        print(
+            f"{comparison.previous_feed_name} ({comparison.previous_service_date}) -> "
+            f"{comparison.next_feed_name} ({comparison.next_service_date}): "
+            f"{comparison.number_of_matched_stops} matched stops, {len(comparison.stop_changes)} stops with changed arrivals"
+        )
+
+
 def main():
+    arguments = parse_command_line_arguments()
+
+    if arguments.serve:
+        serve_processed_data(arguments)
+        return
+
+    if arguments.compare_feeds is not None:
+        compare_bus_feeds(
+            arguments.compare_feeds,
+            WEEKDAY_COLUMN_NAMES.index(arguments.service_weekday),
+            arguments.parse_workers
+        )
+        return
+
     time_bus_data_start = time.time()
-    bus_stops, bus_daily_timed_stops = process_bus_data()
+    bus_stops, bus_arrivals_per_minute = process_bus_data(arguments.parse_workers)
 
     time_bus_arrival_merge_start = time.time()
-    bus_stops_with_arrivals = merge_arrivals_into_corresponding_bus_stops(bus_stops, bus_daily_timed_stops)
+    bus_stops_with_arrivals = merge_arrivals_per_minute_into_corresponding_bus_stops(bus_stops, bus_arrivals_per_minute)
 
     time_bike_data_start = time.time()
     bike_lanes, total_bike_lane_length_metres = process_bike_data()
 
+    time_bike_network_start = time.time()
+    # Bike lanes are analysed in their original form, simplification only affects the exported geometry.
+    bike_network = process_bike_network(bike_lanes, bus_stops_with_arrivals)
+
+    time_multimodal_start = time.time()
+    bus_stop_bike_connectivity = join_bus_stops_with_bike_lanes(
+        bus_stops_with_arrivals,
+        bike_lanes,
+        MULTIMODAL_STOP_RADIUS_IN_METRES
+    )
+
+    time_bike_simplification_start = time.time()
+    bike_lanes = simplify_bike_data(
+        bike_lanes,
+        arguments.bike_lane_tolerance,
+        arguments.bike_lane_decimal_places
+    )
+
     time_green_zone_start = time.time()
     green_zone = process_green_zone(bus_stops_with_arrivals)
 
@@ -201,9 +542,19 @@ def main():
         bus_stops_with_arrivals,
         bike_lanes,
         total_bike_lane_length_metres,
-        green_zone
+        bike_network,
+        green_zone,
+        bus_stop_bike_connectivity
     )
 
+    if arguments.arrival_frames_slot_minutes is not None:
+        arrival_frames = build_arrival_frames_from_arrivals_per_minute(
+            [stop.id for stop in bus_stops],
+            bus_arrivals_per_minute,
+            arguments.arrival_frames_slot_minutes
+        )
+        export_arrival_frames_to_file_for_visualization(arrival_frames, arguments.arrival_frames_encoding)
+
     time_finished = time.time()
 
 
@@ -216,7 +567,11 @@ def main():
         "  Green Zone\n"
         f"    processing took {round(time_export_start - time_green_zone_start, 1)} seconds"
         "  Bike\n"
-        f"    data loading took {round(time_green_zone_start - time_bike_data_start, 1)} seconds\n"
+        f"    data loading took {round(time_bike_network_start - time_bike_data_start, 1)} seconds\n"
+        f"    network analysis took {round(time_multimodal_start - time_bike_network_start, 1)} seconds\n"
+        f"    simplification took {round(time_green_zone_start - time_bike_simplification_start, 1)} seconds\n"
+        "  Multimodal\n"
+        f"    bus stop to bike lane join took {round(time_bike_simplification_start - time_multimodal_start, 1)} seconds\n"
         "  Export\n"
         f"    exporting took {round(time_finished - time_export_start, 1)} seconds\n"
         "\n"
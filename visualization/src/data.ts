@@ -15,10 +15,59 @@ export type BusStopWithArrivalsPerHour = {
 };
 
 
+/**
+ * Separate file with arrivals per stop and time slot.
+ * Slot 0 starts at 00:00 clock time; service after midnight (24:xx in GTFS) is counted in the first hour.
+ *
+ * "sparse": `arrivals[stop]` is a flat list of [gap, run_length, arrivals] triples,
+ *           `gap` being the number of empty slots since the end of the previous run.
+ * "dense":  `arrivals` is base64 of a row-major little-endian Uint16Array (stops x slots).
+ */
+export type ArrivalFrames = {
+    slot_length_in_minutes: number,
+    number_of_slots: number,
+    stop_ids: string[],
+    encoding: "sparse" | "dense",
+    arrivals: number[][] | string,
+};
+
+
 export type BikeLane = {
     line_points: LatitudeLongitude[]
 };
 
+export type BikeNetworkComponent = {
+    number_of_nodes: number,
+    number_of_edges: number,
+    length_in_metres: number,
+};
+
+export type BikeNetworkGap = {
+    // A lane end, and the nearest point of a lane in the other component.
+    from_location: LatitudeLongitude,
+    to_location: LatitudeLongitude,
+    from_component: number,
+    to_component: number,
+    distance_in_metres: number,
+};
+
+export type BikeNetworkReachability = {
+    name: string,
+    location: LatitudeLongitude,
+    distance_to_network_in_metres: number | null,
+    reachable_length_in_metres: number,
+};
+
+export type BikeNetwork = {
+    number_of_nodes: number,
+    number_of_edges: number,
+    components: BikeNetworkComponent[],
+    gaps: BikeNetworkGap[],
+    p_plus_r_reachability: BikeNetworkReachability[],
+    // Stop id -> [distance to network in metres (null if too far), reachable length in metres].
+    bus_stop_reachability: { [stopId: string]: [number | null, number] },
+};
+
 export type PPlusR = {
     name: string,
     location: LatitudeLongitude
@@ -31,6 +80,14 @@ export type GreenZone = {
 };
 
 
+export type BusStopBikeConnectivity = {
+    stop_id: string,
+    distance_to_nearest_bike_lane_in_metres: number | null,
+    bike_lane_length_within_radius_in_metres: number,
+    connectivity_score: number,
+};
+
+
 export type VisualizationData = {
     bus: {
         stops_with_arrivals: BusStopWithArrivalsPerHour[],
@@ -38,6 +95,7 @@ export type VisualizationData = {
     bike: {
         bike_lanes: BikeLane[],
         total_length_in_metres: number,
+        network: BikeNetwork,
     },
     p_plus_r: {
         existing: PPlusR[],
@@ -45,5 +103,9 @@ export type VisualizationData = {
     },
     green_zone: {
         green_zone: GreenZone
+    },
+    multimodal: {
+        radius_in_metres: number,
+        stop_connectivity: BusStopBikeConnectivity[],
     }
 };